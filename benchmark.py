@@ -0,0 +1,203 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+import classes
+from classes.bb60c_class import BB60C_INTERFACE
+from classes.g_code_cntrl_class import PrinterController
+from classes.grbl_protocol import GrblProtocol
+from classes.grbl_sim import GrblSimulator
+from classes.synthetic_iq import SyntheticIQ
+from classes.analyzer_backend import SimulatedBB60C
+from classes.scan_reader import open_scan
+from classes import scan_path, timing
+
+'''
+Offline benchmarks: no BB60C, no libbb_api and no gantry needed
+dsp      FFT -> peak throughput on synthetic IQ (tone + noise), per estimator and capture count
+capture  capture -> FFT -> peak through the acquisition pipeline on a simulated BB60C streaming in real time
+storage  incremental writer, save_data pickle and open_scan load times, per raw IQ encoding (size, ratio)
+scan     end-to-end scan of a grid through PrinterController + GrblProtocol on a simulated GRBL
+
+python benchmark.py [--only dsp capture scan] [--points 200] [--time-scale 20] [--pty] [--json results.json]
+'''
+
+logger = logging.getLogger("BENCHMARK")
+
+
+def synthetic_source(bb60c, snr_db):
+    return SyntheticIQ(bb60c.samples_per_capture, bb60c.bandwidth, power_dbm=-60.0, snr_db=snr_db)
+
+
+def bench_dsp(points, snr_db, capture_counts=(1, 10, 50), estimators=('fft', 'band'), dtypes=('float64', 'float32')):
+    results = []
+    for estimator, dsp_dtype in ((e, d) for e in estimators for d in dtypes):
+        for num_captures in capture_counts:
+            bb60c = BB60C_INTERFACE(num_captures=num_captures, estimator=estimator, peak_window=8, dsp_dtype=dsp_dtype)
+            source = synthetic_source(bb60c, snr_db)
+            acquisition = bb60c.iq_pool.acquire()
+            ## warm up (buffers, FFT plans)
+            source.fill(acquisition)
+            bb60c.process_acquisition(acquisition)
+            t0 = time.perf_counter()
+            for _ in range(points):
+                source.fill(acquisition)
+                bb60c.process_acquisition(acquisition)
+            elapsed = time.perf_counter() - t0
+            peak_error = float(np.nanmax(np.abs(bb60c.peaks[1:] - source.power_dbm)))
+            results.append({'estimator': estimator, 'dsp_dtype': dsp_dtype, 'num_captures': num_captures,
+                            'points': points, 'ms_per_point': 1e3*elapsed/points, 'points_per_s': points/elapsed,
+                            'captures_per_s': points*num_captures/elapsed, 'max_peak_error_db': peak_error})
+            logger.info(f'dsp {estimator} {dsp_dtype} x{num_captures}: {1e3*elapsed/points:.3f} ms/point, '
+                        f'{points*num_captures/elapsed:.0f} captures/s, peak error {peak_error:.3f} dB')
+    return results
+
+
+def bench_capture(points, capture_counts=(1, 10), estimators=('fft', 'band')):
+    ## the device streams at 40 MS/s (decimation 1), so capture time bounds the throughput
+    results = []
+    for estimator in estimators:
+        for num_captures in capture_counts:
+            bb60c = BB60C_INTERFACE(num_captures=num_captures, estimator=estimator, peak_window=8,
+                                    backend=SimulatedBB60C(realtime=True, seed=0))
+            bb60c.initialize_device()
+            bb60c.start_pipeline()
+            t0 = time.perf_counter()
+            handles = [bb60c.submit_capture() for _ in range(points)]
+            for handle in handles:
+                handle.result()
+            elapsed = time.perf_counter() - t0
+            bb60c.stop_pipeline()
+            bb60c.close_device()
+            capture_bound = points*num_captures*bb60c.samples_per_capture/bb60c.bandwidth
+            results.append({'estimator': estimator, 'num_captures': num_captures, 'points': points,
+                            'points_per_s': points/elapsed, 'capture_bound_s': capture_bound, 'elapsed_s': elapsed})
+            logger.info(f'capture {estimator} x{num_captures}: {points/elapsed:.1f} points/s '
+                        f'({elapsed:.3f} s, {capture_bound:.3f} s of IQ)')
+    return results
+
+
+def bench_storage(points, snr_db, num_captures=10,
+                  encodings=((None, False), ('zlib', False), ('lzma', False), (None, True), ('zlib', True))):
+    ## encodings: (iq_codec, iq_quantize) pairs, see classes/iq_codec.py
+    results = []
+    for codec, quantize in encodings:
+        result = {'iq_codec': codec, 'iq_quantize': quantize}
+        with tempfile.TemporaryDirectory() as tmp:
+            bb60c = BB60C_INTERFACE(num_captures=num_captures, peak_window=8, iq_codec=codec, iq_quantize=quantize)
+            bb60c.set_dir(tmp)
+            source = synthetic_source(bb60c, snr_db)
+            acquisition = bb60c.iq_pool.acquire()
+
+            writer = bb60c.open_writer('bench', keep_raw=True)
+            t0 = time.perf_counter()
+            for i in range(points):
+                source.fill(acquisition)
+                bb60c.process_acquisition(acquisition, coords=(i, 0, 0))
+            result['scan_with_writer_s'] = time.perf_counter() - t0
+            result['iq_ratio'] = writer.codec_stats.ratio if writer.encoded else 1.0
+            bb60c.close_writer()
+            result['scan_iq_mb'] = os.path.getsize(os.path.join(tmp, 'bench.scan', 'iq.bin')) / 1e6
+
+            t0 = time.perf_counter()
+            bb60c.save_data('bench')
+            result['save_data_s'] = time.perf_counter() - t0
+            result['pickle_mb'] = os.path.getsize(os.path.join(tmp, 'bench.pkl')) / 1e6
+
+            for name, path in (('pkl', os.path.join(tmp, 'bench.pkl')), ('scan', os.path.join(tmp, 'bench.scan'))):
+                t0 = time.perf_counter()
+                scan = open_scan(path)
+                result[f'open_{name}_s'] = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                for iq in scan.iq:
+                    np.abs(iq).sum()
+                result[f'read_all_iq_{name}_s'] = time.perf_counter() - t0
+        logger.info(f'storage {codec}{" int16" if quantize else ""}: '
+                    + ', '.join(f'{k} {v:.3f}' for k, v in result.items() if isinstance(v, float)))
+        results.append(result)
+    return results
+
+
+def bench_scan(grids, capture_counts, snr_db, time_scale, settle=0.5, pty=False):
+    ## pty=True: PrinterController opens the simulator's pseudo-terminal like a real serial port
+    results = []
+    for num_cols, num_rows in grids:
+        for num_captures in capture_counts:
+            sim = GrblSimulator(time_scale=time_scale)
+            if pty:
+                gantry = PrinterController(port=sim.serve_pty())
+                gantry.init_controller(confirm_origin=False)
+            else:
+                gantry = PrinterController()
+                gantry.protocol = GrblProtocol(sim)
+                gantry.protocol.wait_for_banner(timeout=1.0)
+            bb60c = BB60C_INTERFACE(num_captures=num_captures, peak_window=8)
+            source = synthetic_source(bb60c, snr_db)
+            ## the capture itself takes num_captures*samples/bandwidth on the real device
+            capture_time = num_captures*bb60c.samples_per_capture/bb60c.bandwidth
+
+            grid = scan_path.rect_grid((1, 1, 1), (6, 0, 0), (0, 0, 6), num_cols, num_rows)
+            order = scan_path.serpentine(num_cols, num_rows)
+
+            dsp_time = [0.0]
+
+            def acquire(indx, point):
+                acquisition = bb60c.iq_pool.acquire()
+                source.fill(acquisition)
+                time.sleep(capture_time/time_scale)
+                t0 = time.perf_counter()
+                bb60c.process_acquisition(acquisition, coords=gantry.get_coordinates())
+                dsp_time[0] += time.perf_counter() - t0
+                bb60c.iq_pool.release(acquisition)
+
+            t0 = time.perf_counter()
+            scan_path.run_path(gantry, grid, order, on_point=acquire, settle=settle/time_scale)
+            elapsed = time.perf_counter() - t0
+            gantry.close_controller()
+            sim.close()
+            ## motion, settle and capture run time_scale times faster than real time, the DSP does not
+            simulated = (elapsed - dsp_time[0])*time_scale + dsp_time[0]
+            points = num_cols*num_rows
+            results.append({'grid': [num_cols, num_rows], 'num_captures': num_captures, 'wall_s': elapsed,
+                            'simulated_s': simulated, 'dsp_s': dsp_time[0], 'points_per_minute': 60*points/simulated,
+                            'serial_lines': sim.commands})
+            logger.info(f'scan {num_cols}x{num_rows} x{num_captures}: {simulated:.1f} s simulated, '
+                        f'{60*points/simulated:.1f} points/min')
+    return results
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Offline scan benchmarks (synthetic IQ, simulated GRBL)')
+    parser.add_argument('--only', nargs='+', choices=('dsp', 'capture', 'storage', 'scan'),
+                        default=('dsp', 'capture', 'storage', 'scan'))
+    parser.add_argument('--points', type=int, default=200, help='acquisitions per DSP/storage run')
+    parser.add_argument('--snr', type=float, default=30.0, help='synthetic tone SNR [dB]')
+    parser.add_argument('--time-scale', type=float, default=20.0, help='simulated gantry speed up')
+    parser.add_argument('--pty', action='store_true', help='scan through a pseudo-terminal serial port')
+    parser.add_argument('--json', default=None, help='write the results to this file')
+    args = parser.parse_args()
+
+    classes.setup_logging()
+    ## per point log lines would dominate the DSP timings
+    logging.getLogger("BB60C").setLevel(logging.WARNING)
+    logging.getLogger("PRINTER").setLevel(logging.WARNING)
+
+    timing.TIMER.reset()
+    results = {}
+    if 'dsp' in args.only:
+        results['dsp'] = bench_dsp(args.points, args.snr)
+    if 'capture' in args.only:
+        results['capture'] = bench_capture(args.points)
+    if 'storage' in args.only:
+        results['storage'] = bench_storage(args.points, args.snr)
+    if 'scan' in args.only:
+        results['scan'] = bench_scan(((3, 8), (10, 10)), (1, 10), args.snr, args.time_scale, pty=args.pty)
+    results['stages'] = timing.TIMER.summary()['stages']
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        logger.info(f'Results saved to {args.json}')
@@ -1,6 +1,6 @@
-import pickle
+from classes.scan_reader import open_scan
 dir = 'data_test'
-with open(dir + '/test_data.pkl', 'rb') as f:
-    data = pickle.load(f)
+## works for both test_data.scan directories and legacy test_data.pkl files
+scan = open_scan(dir + '/test_data.pkl')
 
-print(data['peaks'])
\ No newline at end of file
+print(scan.peaks)
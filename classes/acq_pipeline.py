@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class AcquisitionHandle:
+    ## Returned per submitted acquisition
+    ## captured -> set once the IQ is in memory (safe to move the gantry)
+    ## future   -> resolves to the acquisition index once FFT and peak extraction are done
+    ## coords   -> gantry position passed on to process_acquisition
+
+    def __init__(self, coords=None):
+        self.coords = coords
+        self.captured = threading.Event()
+        self.future = Future()
+
+    def wait_captured(self, timeout=None):
+        if not self.captured.wait(timeout):
+            raise TimeoutError('Acquisition not captured in time')
+        ## surface capture errors right away instead of at result()
+        if self.future.done() and self.future.exception() is not None:
+            raise self.future.exception()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class AcquisitionPipeline:
+    ## Overlaps IQ capture with DSP using two threads:
+    ## capture thread: takes requests, captures raw IQ, puts it in a bounded queue
+    ## DSP thread: takes raw acquisitions in order, FFT + averaging + peak extraction
+    ## The bounded queue gives backpressure, the capture thread blocks when DSP falls behind
+
+    _STOP = object()
+
+    def __init__(self, bb60c, max_pending=4):
+        self.logger = logging.getLogger("PIPELINE")
+        self.bb60c = bb60c
+        self._requests = queue.Queue()
+        self._raw = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._capture_thread = threading.Thread(target=self._capture_loop, name='bb60c-capture', daemon=True)
+        self._dsp_thread = threading.Thread(target=self._dsp_loop, name='bb60c-dsp', daemon=True)
+        self._capture_thread.start()
+        self._dsp_thread.start()
+
+    def submit(self, coords=None):
+        handle = AcquisitionHandle(coords)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Pipeline is closed')
+            self._requests.put(handle)
+        return handle
+
+    def close(self, wait=True):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(self._STOP)
+        if wait:
+            self._capture_thread.join()
+            self._dsp_thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ######### Worker threads #########
+    def _capture_loop(self):
+        while True:
+            handle = self._requests.get()
+            if handle is self._STOP:
+                self._raw.put(self._STOP)
+                return
+            if not handle.future.set_running_or_notify_cancel():
+                handle.captured.set()
+                continue
+            try:
+                acquisition = self.bb60c.capture_raw()
+            except BaseException as e:
+                self.logger.error(f'Capture failed: {e}')
+                handle.future.set_exception(e)
+                handle.captured.set()
+                continue
+            handle.captured.set()
+            ## blocks while max_pending acquisitions wait for DSP
+            self._raw.put((handle, acquisition))
+
+    def _dsp_loop(self):
+        while True:
+            item = self._raw.get()
+            if item is self._STOP:
+                return
+            handle, acquisition = item
+            try:
+                self.bb60c.process_acquisition(acquisition, handle.coords)
+                handle.future.set_result(len(self.bb60c.fft_data) - 1)
+            except BaseException as e:
+                self.logger.error(f'Processing failed: {e}')
+                handle.future.set_exception(e)
+            finally:
+                ## the result keeps its own copy, a failed point must not shrink the pool either
+                self.bb60c.iq_pool.release(acquisition)
@@ -0,0 +1,120 @@
+import numpy as np
+import logging
+from classes import scan_path
+
+'''
+Adaptive (coarse to fine) scan: a coarse grid first, then only the cells that look interesting are split
+into 4 (quadtree) until the step reaches min_step.
+
+Points live on an integer lattice of the finest level, a coarse point (col, row) is (col*S, row*S) with
+S = 2**levels, and its gantry position is origin + lattice/S * (col_step, row_step).
+
+cell (corners a b c d, size s)         split -> 5 new points (edge midpoints + centre), 4 cells of size s/2
+a ---- b                               a -- + -- b
+|      |                               |    |    |
+|      |                               + -- + -- +
+d ---- c                               |    |    |
+                                       d -- + -- c
+A cell is split when its strongest corner is above power_threshold [dBm] or the spread of its corners
+divided by the cell size is above gradient_threshold [dB/mm]. Corners without a peak count as no power.
+'''
+
+
+class AdaptiveScan:
+
+    def __init__(self, gantry, bb60c, power_threshold=None, gradient_threshold=None, min_step=1.5, settle=0.0,
+                 feed_rates=scan_path.DEFAULT_FEED_RATES):
+        if power_threshold is None and gradient_threshold is None:
+            raise ValueError('Adaptive scan needs power_threshold and/or gradient_threshold')
+        self.logger = logging.getLogger("ADAPTIVE_SCAN")
+        self.gantry = gantry
+        self.bb60c = bb60c
+        self.power_threshold = power_threshold
+        self.gradient_threshold = gradient_threshold
+        self.min_step = min_step
+        self.settle = settle
+        self.feed_rates = feed_rates
+        ## lattice point (i, j) -> acquisition index in bb60c
+        self.points = {}
+        ## scan plane, set by run()
+        self.origin = self.col_step = self.row_step = None
+        self.levels = 0
+        self.scale = 1
+
+    def run(self, origin, col_step, row_step, num_cols, num_rows):
+        ## returns (lattice points (N, 2), positions (N, 3), acquisition indices (N,)) of every point measured
+        self.origin = np.asarray(origin, dtype=float)
+        self.col_step = np.asarray(col_step, dtype=float)
+        self.row_step = np.asarray(row_step, dtype=float)
+        coarse_step = min(np.linalg.norm(self.col_step), np.linalg.norm(self.row_step))
+        self.levels = max(0, int(np.floor(np.log2(coarse_step / self.min_step))))
+        self.scale = 2**self.levels
+        self.points = {}
+
+        ## coarse pass, serpentine like harmonic_scan
+        s = self.scale
+        coarse = [(c*s, r*s) for r in range(num_rows) for c in range(num_cols)]
+        self._measure([coarse[i] for i in scan_path.serpentine(num_cols, num_rows)], travel=False)
+        cells = [(c*s, r*s, s) for r in range(num_rows - 1) for c in range(num_cols - 1)]
+
+        for level in range(self.levels):
+            split = [cell for cell in cells if self._refine(cell)]
+            if not split:
+                break
+            new_points = {}
+            cells = []
+            for i, j, size in split:
+                h = size // 2
+                for p in ((i + h, j), (i, j + h), (i + h, j + h), (i + size, j + h), (i + h, j + size)):
+                    if p not in self.points:
+                        new_points[p] = None
+                cells.extend([(i, j, h), (i + h, j, h), (i, j + h, h), (i + h, j + h, h)])
+            self.logger.info(f'Level {level + 1}: {len(split)} cells split, {len(new_points)} new points')
+            self._measure(list(new_points))
+
+        uniform = ((num_cols - 1)*s + 1) * ((num_rows - 1)*s + 1)
+        self.logger.info(f'{len(self.points)} points measured, {uniform} for a uniform grid at the finest step')
+        lattice = np.array(list(self.points.keys()), dtype=int).reshape(-1, 2)
+        return lattice, self.position(lattice), np.array(list(self.points.values()), dtype=int)
+
+    def position(self, lattice):
+        ## gantry (x, y, z) of lattice points (N, 2)
+        lattice = np.asarray(lattice, dtype=float).reshape(-1, 2) / self.scale
+        return self.origin + lattice[:, :1]*self.col_step + lattice[:, 1:]*self.row_step
+
+    def _measure(self, lattice_points, travel=True):
+        ## visit the points (travel optimal order from the current position) and store their acquisitions
+        ## DSP runs in the pipeline while the gantry moves, all results are collected before the next level
+        positions = self.position(lattice_points)
+        if travel and len(positions) > 1:
+            start = np.asarray(self.gantry.get_coordinates(), dtype=float)
+            order = scan_path.travel_optimal(np.vstack([start, positions]), 0, self.feed_rates)[1:] - 1
+        else:
+            order = scan_path.raster(len(positions))
+        handles = {}
+
+        def acquire(indx, point):
+            handles[lattice_points[indx]] = self.bb60c.submit_capture(coords=self.gantry.get_coordinates())
+            handles[lattice_points[indx]].wait_captured()
+
+        scan_path.run_path(self.gantry, positions, order, on_point=acquire, settle=self.settle)
+        for p, handle in handles.items():
+            self.points[p] = handle.result()
+
+    def _power(self, p):
+        peak = self.bb60c.peaks[self.points[p]]
+        return -np.inf if np.isnan(peak) else peak
+
+    def _refine(self, cell):
+        i, j, size = cell
+        if size < 2:
+            return False
+        power = np.array([self._power(p) for p in ((i, j), (i + size, j), (i, j + size), (i + size, j + size))])
+        if self.power_threshold is not None and power.max() >= self.power_threshold:
+            return True
+        if self.gradient_threshold is not None and np.isfinite(power).any():
+            ## a corner with a peak next to one without is always a large gradient
+            spread = power.max() - power.min()
+            size_mm = size / self.scale * min(np.linalg.norm(self.col_step), np.linalg.norm(self.row_step))
+            return spread / size_mm >= self.gradient_threshold
+        return False
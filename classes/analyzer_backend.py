@@ -0,0 +1,151 @@
+import numpy as np
+import logging
+import time
+
+'''
+Analyzer backends used by BB60C_INTERFACE (backend=...)
+
+BBApiBackend      the real BB60C through the vendor ctypes API (libbb_api is only loaded when opened)
+SimulatedBB60C    software BB60C streaming IQ at the configured rate, no device or library needed
+
+Both implement:
+|-> open()                                                      connect, returns a handle
+|-> configure(ref_level, center_freq, decimation, filter_bw)    IQ streaming setup and start
+|-> get_IQ_into(iq_data, purge)                                 fill a complex64 array with the next samples,
+                                                                returns {'data_remaining', 'sample_loss',
+                                                                'sec', 'nano'} like bbGetIQUnpacked
+|-> close()
+'''
+
+## IQ sample rate of the BB60C before decimation [S/s]
+BASE_SAMPLE_RATE = 40.0e6
+
+
+def get_backend(backend):
+    ## None / 'bb_api' -> real device, 'sim' -> SimulatedBB60C(), anything else is used as is
+    if backend is None or backend == 'bb_api':
+        return BBApiBackend()
+    if backend == 'sim':
+        return SimulatedBB60C()
+    if isinstance(backend, str):
+        raise ValueError(f'Unknown analyzer backend {backend}')
+    return backend
+
+
+class BBApiBackend:
+
+    def __init__(self):
+        self.handle = None
+        self._api = None
+
+    def open(self):
+        from classes import bb_api
+        self._api = bb_api
+        self.handle = bb_api.bb_open_device()["handle"]
+        return self.handle
+
+    def configure(self, ref_level, center_freq, decimation, filter_bw):
+        api = self._api
+        api.bb_configure_ref_level(self.handle, ref_level)
+        api.bb_configure_gain_atten(self.handle, api.BB_AUTO_GAIN, api.BB_AUTO_ATTEN)
+        api.bb_configure_IQ_center(self.handle, center_freq)
+        api.bb_configure_IQ(self.handle, decimation, filter_bw)
+        api.bb_initiate(self.handle, api.BB_STREAMING, api.BB_STREAM_IQ)
+
+    def get_IQ_into(self, iq_data, purge=False):
+        ## fills iq_data in place, see bb_get_IQ_unpacked_into
+        return self._api.bb_get_IQ_unpacked_into(self.handle, iq_data, self._api.BB_TRUE if purge else self._api.BB_FALSE)
+
+    def close(self):
+        if self.handle is not None:
+            self._api.bb_close_device(self.handle)
+            self.handle = None
+
+
+def gaussian_spot(center, peak_dbm=-50.0, width=10.0, floor_dbm=-120.0):
+    ## field model: Gaussian hot spot of 1/e^2 radius width [mm] around center (x, y, z) over a floor
+    center = np.asarray(center, dtype=float)
+
+    def field(x, y, z):
+        r2 = np.sum((np.array([x, y, z], dtype=float) - center)**2)
+        power = 10**(peak_dbm/10)*np.exp(-2*r2/width**2) + 10**(floor_dbm/10)
+        return 10*np.log10(power)
+    return field
+
+
+class SimulatedBB60C:
+    ## Streaming model: the device produces samples at sample_rate from open/configure on and buffers
+    ## up to buffer_samples of them. Reading slower than real time fills the buffer (data_remaining),
+    ## overflowing it drops the oldest samples and flags sample_loss, purge drops everything buffered.
+    ## realtime=False never waits for samples (as fast as the host can go, timestamps follow the stream).
+    ##
+    ## Signal: tones at the centre frequency + offsets, their power [dBm] given by field(x, y, z) at
+    ## position() (e.g. gantry.get_coordinates), plus white noise of noise_dbm per sample.
+
+    def __init__(self, field=None, position=None, tones=((0.0, 0.0),), noise_dbm=-100.0, realtime=True,
+                 buffer_samples=2**22, seed=None):
+        self.logger = logging.getLogger("BB60C_SIM")
+        self.field = field or (lambda x, y, z: -60.0)
+        self.position = position or (lambda: (0.0, 0.0, 0.0))
+        ## (offset from the centre frequency [Hz], power relative to the field [dB])
+        self.tones = tones
+        self.noise_dbm = noise_dbm
+        self.realtime = realtime
+        self.buffer_samples = buffer_samples
+        self.handle = None
+        self.sample_rate = BASE_SAMPLE_RATE
+        self.center_freq = None
+        self._rng = np.random.default_rng(seed)
+        self._start = None ## host time of the first streamed sample
+        self._read = 0     ## samples handed out (or dropped) so far
+
+    def open(self):
+        self.handle = 0
+        self._start = time.time()
+        return self.handle
+
+    def configure(self, ref_level, center_freq, decimation, filter_bw):
+        self.center_freq = center_freq
+        self.sample_rate = BASE_SAMPLE_RATE / decimation
+        self._start = time.time()
+        self._read = 0
+        self.logger.info(f'Simulated streaming at {self.sample_rate/1e6:.2f} MS/s around {center_freq/1e9:.3f} GHz')
+
+    def get_IQ_into(self, iq_data, purge=False):
+        n = iq_data.size
+        sample_loss = 0
+        if self.realtime:
+            produced = int((time.time() - self._start) * self.sample_rate)
+            if purge:
+                self._read = max(self._read, produced)
+            elif produced - self._read > self.buffer_samples:
+                self._read = produced - self.buffer_samples
+                sample_loss = 1
+            ## wait for the stream to produce the samples of this capture
+            wait = (self._read + n - produced) / self.sample_rate
+            if wait > 0:
+                time.sleep(wait)
+            produced = max(produced, self._read + n)
+        first = self._read
+        self._read += n
+        self._fill(iq_data.reshape(-1), first)
+
+        t = self._start + first / self.sample_rate
+        sec = int(t)
+        return {"status": 0, "iq": iq_data,
+                "data_remaining": max(0, produced - self._read) if self.realtime else 0,
+                "sample_loss": sample_loss, "sec": sec, "nano": int((t - sec) * 1e9)}
+
+    def _fill(self, out, first):
+        ## phase continuous tones (sample index from the start of the stream) plus noise, in sqrt(mW)
+        power_dbm = self.field(*self.position())
+        t = (first + np.arange(out.size)) / self.sample_rate
+        signal = np.zeros(out.size, dtype=np.complex128)
+        for offset, rel_db in self.tones:
+            signal += 10**((power_dbm + rel_db)/20) * np.exp(2j*np.pi*offset*t)
+        noise_std = 10**(self.noise_dbm/20) / np.sqrt(2)
+        signal += noise_std*(self._rng.standard_normal(out.size) + 1j*self._rng.standard_normal(out.size))
+        out[:] = signal
+
+    def close(self):
+        self.handle = None
@@ -1,14 +1,27 @@
-from classes.bb_api import *
+from classes.analyzer_backend import get_backend
+from classes.iq_pool import IQBufferPool
+from classes.acq_pipeline import AcquisitionPipeline
+from classes.scan_storage import ScanWriter
+from classes.scan_reader import open_scan
+from classes.scan_result import ScanResult
+from classes.iq_codec import CodecStats, check_codec, encode_chunks
+from classes.peaks import window_peaks, interpolate_peaks
+from classes import fft_plots
+from classes.grid_map import assemble_grid
+from classes import timing
 import numpy as np
-from scipy import signal
+from scipy import signal, stats
 from scipy.fft import fft, fftshift
 import matplotlib.pyplot as plt
 import logging
 import pickle
 import os
+import time
 
 '''
-data
+All results live in self.result (ScanResult, one ndarray per quantity), exposed as:
+
+data (self.result.iq)
 |-> acquisition 1
     |-> capture_1
     |-> capture_2
@@ -20,35 +33,47 @@ data
     |-> ...
     |-> capture_num_captures
 |-> ...
+(in contiguous capture mode each acquisition is a single block of contiguous_samples)
+(with memory_budget, the raw IQ past the budget is in the spill file or dropped, see ScanResult)
 
-fft_data
+fft_data (self.result.spectra)
 |-> fft acquisition 1 (average of all captures)
 |-> fft acquisition 2 (average of all captures)
 |-> ...
+
+peaks / peaks_indxs (self.result.peaks / self.result.peaks_indxs)
+|-> one entry per acquisition, NaN / -1 when no peak was found
 '''
 
 
 class BB60C_INTERFACE:
 
     ## Constructor
-    def __init__(self, ref_level=-60.0, center_freq=1.0e9, num_captures=10, decimation=1):
+    def __init__(self, ref_level=-60.0, center_freq=1.0e9, num_captures=10, decimation=1, fft_workers=-1,
+                 capture_mode='captures', contiguous_samples=None, segment_overlap=0.5,
+                 peak_window=None, peak_interp=None, peak_prominence=1.0, estimator='fft', band_bins=8,
+                 dwell='fixed', min_captures=2, max_captures=None, target_ci=0.5, target_snr=None,
+                 dwell_confidence=0.95, backend=None, dsp_dtype=np.float64, memory_budget=None,
+                 raw_policy='spill', iq_codec=None, iq_quantize=False):
         ## Logging
         self.logger = logging.getLogger("BB60C")
 
         ## Data
-        self.data = []
-        self.fft_data = []
-        self.peaks_indxs = []
-        self.peaks = []
         self.dir = None
         self.comment = None
         self.num_captures = num_captures
+        ## incremental on-disk writer (see open_writer)
+        self.writer = None
+        self.scan_path = None ## .scan directory of the last writer
         
         ## Device Related
 
         ## Keys are the decimation and values are the max filter bandwidths as per the API
         max_filter_bw = {1: 27e6, 2:17.8e6, 4:8e6, 8:3.75e6, 16:2e6, 32:1e6} 
+        ## None/'bb_api' -> real BB60C (vendor API), 'sim' -> SimulatedBB60C, or a backend object
+        self.backend = get_backend(backend)
         self.handle = None
+        self.pipeline = None
         self.ref_level = ref_level
         self.center_freq = center_freq
         self.samples_per_capture = 4096
@@ -56,64 +81,362 @@ class BB60C_INTERFACE:
         self.bandwidth = 40.0e6 / self.decimation
         self.filter_bw = max_filter_bw[self.decimation]
 
+        ## Acquisition mode
+        ## 'captures'   -> num_captures separate calls of samples_per_capture samples
+        ## 'contiguous' -> one call of contiguous_samples samples (default num_captures*samples_per_capture)
+        ##                 averaged over overlapping windowed segments (Welch/Bartlett)
+        if capture_mode not in ('captures', 'contiguous'):
+            raise ValueError(f'Unknown capture mode {capture_mode}')
+        if not 0 <= segment_overlap < 1:
+            raise ValueError('segment_overlap must be in [0, 1)')
+        self.capture_mode = capture_mode
+        self.contiguous_samples = contiguous_samples or self.num_captures * self.samples_per_capture
+        if self.contiguous_samples < self.samples_per_capture:
+            raise ValueError('contiguous_samples must hold at least one segment')
+        self.segment_overlap = segment_overlap
+
+        ## Dwell
+        ## 'fixed'    -> num_captures captures per acquisition
+        ## 'adaptive' -> captures until the running harmonic estimate converges: the confidence interval
+        ##               half-width [dB] of the mean peak power is <= target_ci, or its SNR [dB] above the
+        ##               band median is >= target_snr, with min_captures <= captures <= max_captures
+        if dwell not in ('fixed', 'adaptive'):
+            raise ValueError(f'Unknown dwell {dwell}')
+        if dwell == 'adaptive':
+            if self.capture_mode == 'contiguous':
+                raise ValueError('Adaptive dwell needs capture_mode="captures"')
+            if target_ci is None and target_snr is None:
+                raise ValueError('Adaptive dwell needs target_ci and/or target_snr')
+        self.dwell = dwell
+        self.max_captures = max_captures or self.num_captures
+        self.min_captures = max(2, min(min_captures, self.max_captures))
+        self.target_ci = target_ci
+        self.target_snr = target_snr
+        self.dwell_confidence = dwell_confidence
+
+        ## reusable acquisition matrices the IQ is captured into
+        if self.capture_mode == 'contiguous':
+            self.iq_pool = IQBufferPool(1, self.contiguous_samples)
+        elif self.dwell == 'adaptive':
+            ## adaptive acquisitions are the leading rows of a max_captures matrix
+            self.iq_pool = IQBufferPool(self.max_captures, self.samples_per_capture)
+        else:
+            self.iq_pool = IQBufferPool(self.num_captures, self.samples_per_capture)
+
          ## DFT Related
         self.freqs = fftshift(np.fft.fftfreq(self.samples_per_capture, 1/self.bandwidth))
-        self.window = signal.windows.flattop(self.samples_per_capture)
+        ## DSP precision, the IQ itself is always complex64
+        ## float64 -> complex128 FFT and float64 spectra
+        ## float32 -> float32 window, complex64 FFT and float32 spectra (half the memory traffic)
+        ##            vs float64 on the same IQ (tone 10-40 dB over the per-sample noise, measured):
+        ##            'fft'  < 1e-4 dB on the peak and on bins 10 dB or more over the noise floor, < 0.02 dB on every bin
+        ##            'band' < 1e-3 dB on the peak, < 5e-3 dB 10 dB or more over the floor, < 0.2 dB on the floor
+        self.dsp_dtype = np.dtype(dsp_dtype)
+        if self.dsp_dtype not in (np.float32, np.float64):
+            raise ValueError(f'dsp_dtype must be float32 or float64, not {self.dsp_dtype}')
+        self.window = signal.windows.flattop(self.samples_per_capture).astype(self.dsp_dtype)
+        ## scipy.fft worker threads for the batched transform (-1 = all cores)
+        self.fft_workers = fft_workers
+        ## preallocated DSP buffers, (re)built when the number of captures changes
+        self._fft_bufs = None
+
+        ## Peak search
+        ## peak_window=None -> find_peaks over the whole spectrum, closest peak to the center bin
+        ## peak_window=w    -> vectorized search of the center bin +-w only (fast path)
+        ## peak_interp      -> None, 'parabolic' or 'gaussian' sub-bin interpolation
+        self.center_indx = int(self.samples_per_capture/2) ## note all FFTs are the same size
+        self.peak_window = peak_window
+        self.peak_interp = peak_interp
+        self.peak_prominence = peak_prominence
+
+        ## Spectrum estimator
+        ## 'fft'  -> full samples_per_capture point spectrum
+        ## 'band' -> only the center bin +-band_bins (the harmonic), a direct DFT of those bins as one matrix product
+        ##           for all captures, O(N*bins) instead of O(N log N), same scaling so it matches the FFT bins
+        if estimator not in ('fft', 'band'):
+            raise ValueError(f'Unknown estimator {estimator}')
+        self.estimator = estimator
+        self.band_bins = band_bins
+        self._band_matrix = None
+        self._dwell_matrix = None
+        if self.estimator == 'band' or self.dwell == 'adaptive':
+            offsets = np.arange(-band_bins, band_bins + 1)
+            n = np.arange(self.samples_per_capture)
+            ## window folded into the DFT kernel: (samples_per_capture, 2*band_bins + 1)
+            kernel = self.window[:, None] * np.exp(-2j*np.pi*np.outer(n, offsets)/self.samples_per_capture)
+            ## the spectrum needs dsp_dtype precision (complex64 is off by up to 0.1 dB on the bins far under the tone),
+            ## the dwell decision does not and multiplies each complex64 capture as is
+            self._band_matrix = kernel.astype(np.result_type(np.complex64, self.dsp_dtype))
+            self._dwell_matrix = kernel.astype(np.complex64)
+        if self.dwell == 'adaptive':
+            ## two sided Student t quantile for the CI of the mean of n captures, indexed by n
+            n = np.arange(self.max_captures + 1)
+            self._dwell_t = stats.t.ppf((1 + dwell_confidence)/2, np.maximum(n - 1, 1))
+        if self.estimator == 'band':
+            ## spectra (and their frequency axis) only cover the band
+            self.freqs = self.freqs[self.center_indx - band_bins:self.center_indx + band_bins + 1]
+            self.center_indx = band_bins
+
+        ## Results
+        ## memory_budget [bytes]: raw IQ kept in RAM, acquisitions past it follow raw_policy
+        ## 'spill' -> raw IQ appended to <dir>/raw_spill.iq (raw_spill_<n>.iq when taken by an earlier scan), 'drop' -> raw IQ discarded once its spectrum is done
+        ## spectra, peaks and coordinates always stay in memory
+        if raw_policy not in ('spill', 'drop'):
+            raise ValueError(f'Unknown raw policy {raw_policy}')
+        self.memory_budget = memory_budget
+        self.raw_policy = raw_policy
+        self.result = ScanResult(len(self.freqs), iq_budget=memory_budget, spill_path=self._spill_path())
+
+        ## raw IQ on disk (save_data and open_writer): iq_codec None/'zlib'/'lzma' lossless,
+        ## iq_quantize=True stores int16 I/Q with a scale per capture (lossy, see iq_codec.py)
+        check_codec(iq_codec)
+        self.iq_codec = iq_codec
+        self.iq_quantize = iq_quantize
+        self._n_peaked = 0 ## acquisitions already searched for a peak
 
     ######## DEVICE MANAGEMENT ########
     def initialize_device(self):
-        self.handle = bb_open_device()["handle"]
-        bb_configure_ref_level(self.handle, self.ref_level)
-        bb_configure_gain_atten(self.handle, BB_AUTO_GAIN, BB_AUTO_ATTEN)
-        bb_configure_IQ_center(self.handle, self.center_freq)
-        bb_configure_IQ(self.handle, self.decimation, self.filter_bw)
-        bb_initiate(self.handle, BB_STREAMING, BB_STREAM_IQ)
+        self.handle = self.backend.open()
+        self.backend.configure(self.ref_level, self.center_freq, self.decimation, self.filter_bw)
     
     def close_device(self):
-        bb_close_device(self.handle)
+        self.backend.close()
         self.logger.info('Device Closed')
     
-    def capture_data(self):
+    @timing.timed('bb60c.capture_data')
+    def capture_data(self, out=None, coords=None):
         self.logger.info('CAPTURING...')
-        acquisition = []
-        for _ in range(self.num_captures):
-            iq = bb_get_IQ_unpacked(self.handle, self.samples_per_capture, BB_FALSE)["iq"]
-            acquisition.append(iq)
-        self.data.append(acquisition)
+        acquisition = self.capture_raw(out)
         self.logger.info('CALCULATING FFT...')
-        self.calc_fft()
+        try:
+            self.process_acquisition(acquisition, coords)
+        finally:
+            ## the result keeps its own copy, the capture buffer goes back to the pool
+            if out is None:
+                self.iq_pool.release(acquisition)
         return
 
+    @timing.timed('bb60c.capture_raw')
+    def capture_raw(self, out=None):
+        ## captures land directly in the rows of one (num_captures, samples_per_capture) matrix
+        ## in contiguous mode the matrix is a single (1, contiguous_samples) row
+        ## with adaptive dwell only the leading rows that were captured are returned
+        acquisition = self.iq_pool.acquire() if out is None else out
+        try:
+            if self.dwell == 'adaptive':
+                return self._capture_adaptive(acquisition)
+            for row in acquisition:
+                self.backend.get_IQ_into(row, False)
+        except BaseException:
+            ## a failed capture gives its pooled buffer back
+            if out is None:
+                self.iq_pool.release(acquisition)
+            raise
+        return acquisition
+
+    def _capture_adaptive(self, acquisition):
+        ## one capture at a time, each one reduced to its band around the harmonic (peak and median in dB)
+        ## the dB scaling offset cancels in both the CI width and the SNR, so it is left out
+        peak_db = np.empty(len(acquisition))
+        noise_db = np.empty(len(acquisition))
+        n = 0
+        for row in acquisition:
+            self.backend.get_IQ_into(row, False)
+            band = 20*np.log10(np.abs(row @ self._dwell_matrix))
+            peak_db[n] = band.max()
+            noise_db[n] = np.median(band)
+            n += 1
+            if n >= self.min_captures and self.dwell_converged(peak_db[:n], noise_db[:n]):
+                break
+        return acquisition[:n]
+
+    def dwell_converged(self, peak_db, noise_db):
+        ## running estimate = mean of the per capture peak power [dB], like the averaged spectrum
+        n = len(peak_db)
+        if self.target_snr is not None and peak_db.mean() - noise_db.mean() >= self.target_snr:
+            return True
+        if self.target_ci is not None:
+            half_width = self._dwell_t[n] * peak_db.std(ddof=1) / np.sqrt(n)
+            return half_width <= self.target_ci
+        return False
+
+    def capture_timestamped(self, out, purge=False):
+        ## fill the rows of out with consecutive captures and return the device timestamp [s]
+        ## of the first sample of each capture (sec + nano from bbGetIQUnpacked)
+        ## purge=True drops the samples buffered before the first capture
+        timestamps = np.empty(len(out))
+        for i, row in enumerate(out):
+            ret = self.backend.get_IQ_into(row, purge and i == 0)
+            timestamps[i] = ret["sec"] + ret["nano"]*1e-9
+        return timestamps
+
+    @timing.timed('bb60c.process_acquisition')
+    def process_acquisition(self, acquisition, coords=None):
+        ## coords: gantry position of the acquisition
+        timestamp = time.time()
+        spectrum = self.calc_fft(acquisition)
+        overflowing = self.result.overflowing
+        point = self.result.append(spectrum, acquisition, coords, timestamp)
+        timing.count('points')
+        if self.result.overflowing and not overflowing:
+            self.logger.warning(f'Raw IQ memory budget ({self.memory_budget/1e6:.1f} MB) reached at acquisition {point}, '
+                                + ('spilling raw IQ to ' + self.result.spill_file if self.raw_policy == 'spill' else 'dropping raw IQ'))
+        ## peaks are extracted as each acquisition completes
+        self.get_fft_peaks()
+        self.logger.info(f'Acquisition {point}: peak {self.peaks[point]:.2f} dBm ({self.result.n_captures[point]} captures)')
+        if self.writer is not None:
+            peak_indx = int(self.peaks_indxs[point])
+            with timing.stage('bb60c.write'):
+                self.writer.append(acquisition, self.fft_data[point], None if peak_indx < 0 else peak_indx,
+                                   self.peaks[point], coords, timestamp, self.result.peak_offsets[point])
+        return point
+
+    ######## RESULT VIEWS ########
+    @property
+    def data(self):
+        return self.result.iq
+
+    @property
+    def fft_data(self):
+        return self.result.spectra
+
+    @property
+    def peaks(self):
+        return self.result.peaks
+
+    @property
+    def peaks_indxs(self):
+        return self.result.peaks_indxs
+
+    @property
+    def keep_raw(self):
+        ## False: raw IQ is not kept in memory (see open_writer)
+        return self.result.keep_iq
+
+    @keep_raw.setter
+    def keep_raw(self, keep):
+        self.result.keep_iq = keep
+
+    ######## PIPELINED ACQUISITION ########
+    ## capture thread -> bounded queue -> DSP thread (FFT, averaging and peak extraction)
+    def start_pipeline(self, max_pending=4):
+        if self.pipeline is not None:
+            return self.pipeline
+        self.pipeline = AcquisitionPipeline(self, max_pending=max_pending)
+        self.logger.info(f'Acquisition pipeline started (max pending = {max_pending})')
+        return self.pipeline
+
+    def submit_capture(self, coords=None):
+        ## returns an AcquisitionHandle, wait_captured() before moving the gantry
+        if self.pipeline is None:
+            self.start_pipeline()
+        return self.pipeline.submit(coords)
+
+    def stop_pipeline(self, wait=True):
+        if self.pipeline is None:
+            return
+        self.pipeline.close(wait=wait)
+        self.pipeline = None
+        self.logger.info('Acquisition pipeline stopped')
+
     ##### DFT RELATED CALCULATIONS ####
-    def calc_fft(self):
-        fft_acquisition = []
-        ## last acquisition (i.e. 10 capture)
-        acquisition = self.data[-1]
-        for capture in acquisition:
-            ## DFT of the capture
-            dft = fftshift(fft(capture * self.window))
-            dft_pwr = 20*np.log10(np.abs(dft)/self.samples_per_capture) + 13.01
-            fft_acquisition.append(dft_pwr) 
-        ## save only the average of the DFTs of the captures
-        self.fft_data.append(np.mean(fft_acquisition, axis=0))
-
-    def get_fft_peaks(self):
-        center_indx = int(self.samples_per_capture/2) ## note all FFTs are the same size
-        for spectrum in self.fft_data:
-            peaks, _ = signal.find_peaks(spectrum, prominence=1)
-
-            '''
-            check if there's a peak at the center frequency
-            for the scanning experiments this should be the case most of the time
-            given the spurious second harmonic WE are transmitting
-            '''
-            if(len(peaks) > 0):
-                closest_to_zero = np.argmin(np.abs(peaks - center_indx))
-                single_peak = peaks[closest_to_zero]
-                self.peaks_indxs.append(single_peak)
-                self.peaks.append(spectrum[single_peak])
-            else:
-                self.peaks.append(None)
+    @timing.timed('bb60c.calc_fft')
+    def calc_fft(self, acquisition=None):
+        ## acquisition (default: the last one, i.e. 10 capture) as one (num_captures, samples_per_capture) matrix
+        ## returns only the average of the DFTs of the captures
+        if acquisition is None:
+            acquisition = self.result.get_iq(-1)
+            if acquisition is None:
+                raise ValueError('The raw IQ of the last acquisition is not kept (keep_raw=False or dropped), '
+                                 'pass the acquisition')
+        acquisition = np.asarray(acquisition)
+        if acquisition.size == 0:
+            ## nothing captured for this point (e.g. empty fly-scan bin)
+            return np.full(len(self.freqs), np.nan, dtype=self.dsp_dtype)
+        if self.capture_mode == 'contiguous':
+            acquisition = self.get_segments(acquisition.ravel())
+        if self.estimator == 'band':
+            return self._band_spectrum(acquisition)
+        return self._avg_spectrum(acquisition)
+
+    def get_segments(self, block):
+        ## overlapping segments of a contiguous block as a (num_segments, samples_per_capture) view
+        ## overlap = 0 gives Bartlett averaging, 0.5 is the usual Welch choice
+        hop = max(1, self.samples_per_capture - int(round(self.segment_overlap*self.samples_per_capture)))
+        return np.lib.stride_tricks.sliding_window_view(block, self.samples_per_capture)[::hop]
+
+    def _get_fft_buffers(self, num_captures):
+        ## grown only, acquisitions with fewer captures (adaptive dwell) use the leading rows
+        if self._fft_bufs is None or self._fft_bufs[0].shape[0] < num_captures:
+            shape = (num_captures, self.samples_per_capture)
+            windowed = np.empty(shape, dtype=np.result_type(np.complex64, self.window))
+            magnitude = np.empty(shape, dtype=self.window.dtype)
+            self._fft_bufs = (windowed, magnitude)
+        windowed, magnitude = self._fft_bufs
+        return windowed[:num_captures], magnitude[:num_captures]
+
+    def _avg_spectrum(self, captures):
+        windowed, magnitude = self._get_fft_buffers(captures.shape[0])
+        ## DFT of all the captures in a single batched call
+        np.multiply(captures, self.window, out=windowed)
+        dft = fft(windowed, axis=-1, overwrite_x=True, workers=self.fft_workers)
+        np.abs(dft, out=magnitude)
+        np.log10(magnitude, out=magnitude)
+        ## average in dB, then apply the scaling (20*log10(|X|/N) + 13.01) once on the mean
+        ## fftshift commutes with the mean, so only the averaged spectrum is shifted
+        avg = magnitude.mean(axis=0)
+        avg *= 20
+        avg += 13.01 - 20*np.log10(self.samples_per_capture)
+        return fftshift(avg)
+
+    def _band_spectrum(self, captures):
+        ## (num_captures, samples_per_capture) @ (samples_per_capture, band) -> DFT of the band bins
+        if captures.dtype != self._band_matrix.dtype:
+            ## float64: upcast into the preallocated DSP buffer rather than a new copy per call
+            upcast, _ = self._get_fft_buffers(captures.shape[0])
+            np.copyto(upcast, captures)
+            captures = upcast
+        magnitude = np.abs(captures @ self._band_matrix)
+        avg = np.log10(magnitude).mean(axis=0)
+        avg *= 20
+        avg += 13.01 - 20*np.log10(self.samples_per_capture)
+        return avg
+
+    @timing.timed('bb60c.get_fft_peaks')
+    def get_fft_peaks(self, recompute=False):
+        ## only spectra that were not processed yet (peaks are extracted as acquisitions complete)
+        ## recompute=True searches every stored spectrum again (e.g. after changing peak_window)
+        if recompute:
+            self._n_peaked = 0
+        start = self._n_peaked
+        spectra = self.fft_data[start:]
+        if len(spectra) == 0:
+            return
+        if self.peak_window is None:
+            peak_indxs = np.array([-1 if (p := self.find_peak(spectrum)) is None else p for spectrum in spectra])
+        else:
+            peak_indxs = window_peaks(spectra, self.center_indx, self.peak_window, self.peak_prominence)
+        if self.peak_interp:
+            offsets, peaks = interpolate_peaks(spectra, peak_indxs, self.peak_interp)
+        else:
+            offsets = 0.0
+            peaks = np.where(peak_indxs >= 0, spectra[np.arange(len(spectra)), peak_indxs], np.nan)
+        self.result.set_peaks(start, peak_indxs, peaks, offsets)
+        self._n_peaked = start + len(spectra)
+
+    def find_peak(self, spectrum):
+        center_indx = self.center_indx
+        peaks, _ = signal.find_peaks(spectrum, prominence=self.peak_prominence)
+
+        '''
+        check if there's a peak at the center frequency
+        for the scanning experiments this should be the case most of the time
+        given the spurious second harmonic WE are transmitting
+        '''
+        if(len(peaks) > 0):
+            closest_to_zero = np.argmin(np.abs(peaks - center_indx))
+            return peaks[closest_to_zero]
+        return None
     
 
     #### DATA MANAGEMENT ####
@@ -121,11 +444,57 @@ class BB60C_INTERFACE:
         if not os.path.exists(dir):
             os.makedirs(dir)
         self.dir = dir
+        if not self.result.overflowing:
+            self.result.spill_path = self._spill_path()
+
+    def _spill_path(self):
+        if self.raw_policy != 'spill':
+            return None
+        return os.path.join(self.dir or '.', 'raw_spill.iq')
 
     def set_comment(self, comment):
         basic_comment = 'Reference Level: ' + str(self.ref_level) + ' dBm\n' + 'Center Frequency: ' + str(self.center_freq) + ' Hz\n' + 'Decimation: ' + str(self.decimation) + '\n' + 'Filter Bandwidth: ' + str(self.filter_bw) + ' Hz\n'
         self.comment = basic_comment + comment
 
+    def get_metadata(self):
+        return {'ref_level': self.ref_level, 'center_freq': self.center_freq, 'decimation': self.decimation,
+                'filter_bw': self.filter_bw, 'bandwidth': self.bandwidth,
+                'samples_per_capture': self.samples_per_capture, 'num_captures': self.num_captures,
+                'capture_mode': self.capture_mode, 'contiguous_samples': self.contiguous_samples,
+                'segment_overlap': self.segment_overlap, 'peak_window': self.peak_window,
+                'peak_interp': self.peak_interp, 'estimator': self.estimator, 'band_bins': self.band_bins,
+                'dwell': self.dwell, 'min_captures': self.min_captures, 'max_captures': self.max_captures,
+                'target_ci': self.target_ci, 'target_snr': self.target_snr,
+                'dwell_confidence': self.dwell_confidence, 'dsp_dtype': self.dsp_dtype.name,
+                'memory_budget': self.memory_budget, 'raw_policy': self.raw_policy,
+                'iq_codec': self.iq_codec, 'iq_quantize': self.iq_quantize,
+                'Description': self.comment}
+
+    def open_writer(self, filename='data', keep_raw=False):
+        ## from now on every acquisition (raw IQ, spectrum, peak, coordinates) is appended to
+        ## <dir>/<filename>.scan as soon as it is processed
+        ## keep_raw=False: raw IQ is only kept on disk so memory stays flat over the scan
+        ## (save_data reads it back from the .scan for the pickle)
+        path = filename
+        if self.dir:
+            path = self.dir + '/' + path
+        self.writer = ScanWriter(path, self.get_metadata(), self.freqs, spectrum_dtype=self.fft_data.dtype,
+                                 iq_codec=self.iq_codec, iq_quantize=self.iq_quantize)
+        self.keep_raw = keep_raw
+        self.scan_path = self.writer.path
+        self.logger.info(f'Writing acquisitions to {self.writer.path}')
+        return self.writer
+
+    def close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def peak_map(self, **kwargs):
+        ## peaks laid out on the gantry coordinates of their acquisitions (GridMap, see grid_map)
+        return assemble_grid(self.result.coords, self.peaks, **kwargs)
+
+    @timing.timed('bb60c.plot_fft')
     def plot_fft(self, spectrum_index):
         fig_path = 'fft_spectrum_' + str(spectrum_index) + '.png'
 
@@ -133,7 +502,7 @@ class BB60C_INTERFACE:
             fig_path = self.dir + '/' + fig_path
         
         plt.plot(self.freqs, self.fft_data[spectrum_index], label='FFT Spectrum')
-        if self.peaks[spectrum_index] is not None:
+        if self.peaks_indxs[spectrum_index] >= 0:
             plt.scatter(self.freqs[self.peaks_indxs[spectrum_index]], self.fft_data[spectrum_index][self.peaks_indxs[spectrum_index]], 
                     color='red', marker='x', label=f'Peak Value = {self.fft_data[spectrum_index][self.peaks_indxs[spectrum_index]]}')
         plt.title(f'FFT Spectrum #{spectrum_index}')
@@ -146,6 +515,34 @@ class BB60C_INTERFACE:
         return
 
 
+    @timing.timed('bb60c.plot_ffts')
+    def plot_ffts(self, indices=None, workers=None, summary=None):
+        ## all spectra at once (see fft_plots), same PNGs as plot_fft rendered by a process pool
+        ## summary='heatmap' or 'panels': a single fft_summary_<summary>.png instead of one PNG per spectrum
+        if summary is not None:
+            fig_path = 'fft_summary_' + summary + '.png'
+            if self.dir:
+                fig_path = self.dir + '/' + fig_path
+            return [fft_plots.plot_summary(self.freqs, self.fft_data, self.peaks_indxs, fig_path, summary, indices)]
+        return fft_plots.plot_spectra(self.freqs, self.fft_data, self.peaks_indxs, self.dir, indices, workers)
+
+
+    def _raw_iq_from_scan(self):
+        ## keep_raw=False (open_writer): the raw IQ is only on disk, read it back from the .scan
+        if self.scan_path is None or not os.path.isdir(self.scan_path):
+            self.logger.warning('Raw IQ was not kept in memory and no .scan holds it, the pickle has no raw IQ')
+            return self.result.resident_iq
+        ## every appended acquisition is already flushed, the writer may still be open
+        scan = open_scan(self.scan_path)
+        if len(scan) != len(self.result):
+            self.logger.warning(f'{self.scan_path} holds {len(scan)} acquisitions, the scan {len(self.result)}')
+        n_samples = max((iq.shape[-1] for iq in scan.iq if iq.size), default=0)
+        raw_iq = np.zeros((len(scan), max(scan.n_captures, default=0), n_samples), dtype=np.complex64)
+        for i, iq in enumerate(scan.iq):
+            raw_iq[i, :len(iq)] = iq
+        return raw_iq
+
+    @timing.timed('bb60c.save_data')
     def save_data(self, filename='data'):
         fn = filename + '.pkl'
 
@@ -154,8 +551,27 @@ class BB60C_INTERFACE:
             fn = self.dir + '/' + fn 
 
         with open(fn, 'wb') as f:
-            data_to_save = {'raw_iq': self.data, 'fft_avg': self.fft_data, 'peaks': self.peaks, 
-                            'peaks_indxs': self.peaks_indxs, 'Description': self.comment}  
+            ## arrays of the ScanResult, raw_iq is zero padded to the widest acquisition (see n_captures)
+            ## and only holds the points kept in memory, spilled points are referenced in raw_iq_spill
+            ## with iq_codec / iq_quantize raw_iq is an encode_chunks dict instead of an array
+            raw_iq = self.result.resident_iq
+            if not self.keep_raw:
+                raw_iq = self._raw_iq_from_scan()
+            codec_stats = None
+            if self.iq_codec is not None or self.iq_quantize:
+                codec_stats = CodecStats()
+                raw_iq = encode_chunks(raw_iq, self.iq_codec, self.iq_quantize, stats=codec_stats)
+            data_to_save = {'raw_iq': raw_iq, 'fft_avg': self.fft_data, 'peaks': self.peaks, 
+                            'peaks_indxs': self.peaks_indxs, 'peak_offsets': self.result.peak_offsets,
+                            'n_captures': self.result.n_captures,
+                            'coords': self.result.coords, 'Description': self.comment}  
+            if self.result.spilled:
+                ## relative to the pickle, so the scan directory can be moved as a whole
+                data_to_save['raw_iq_spill'] = {'path': os.path.relpath(self.result.spill_file,
+                                                                        os.path.dirname(os.path.abspath(fn))),
+                                                'points': dict(self.result.spilled)}
             pickle.dump(data_to_save, f)
         self.logger.info(f'Data saved to {fn}')
+        if codec_stats is not None:
+            self.logger.info(f'{codec_stats.summary()}, {os.path.getsize(fn)/1e6:.1f} MB on disk')
         return
@@ -5,6 +5,8 @@
 
 from ctypes import *
 import numpy
+import time
+from classes.timing import TIMER
 
 bblib = CDLL("/usr/local/lib/libbb_api.so")
 
@@ -301,8 +303,11 @@ bbGetErrorString.restype = c_char_p
 # ---------------------------------- Utility ----------------------------------
 
 def error_check(func):
+    stage = "bb_api." + func.__name__
     def print_status_if_error(*args, **kwargs):
+        t0 = time.perf_counter()
         return_vars = func(*args, **kwargs)
+        TIMER.record(stage, time.perf_counter() - t0)
         if "status" not in return_vars.keys():
             return return_vars
         status = return_vars["status"]
@@ -703,6 +708,29 @@ def bb_get_IQ_unpacked(device, iq_count, purge, triggers = c_int(0), trigger_cou
         "nano": nano.value
     }
 
+# Same as bb_get_IQ_unpacked but fills iq_data (a C-contiguous complex64
+# array, e.g. one row of a preallocated acquisition matrix) in place
+# instead of allocating a new array for every capture.
+@error_check
+def bb_get_IQ_unpacked_into(device, iq_data, purge, triggers = c_int(0), trigger_count = 0):
+    data_remaining = c_int(-1)
+    sample_loss = c_int(-1)
+    sec = c_int(-1)
+    nano = c_int(-1)
+
+    status = bbGetIQUnpacked(device, iq_data, iq_data.size, triggers, trigger_count, purge,
+                             byref(data_remaining), byref(sample_loss),
+                             byref(sec), byref(nano))
+
+    return {
+        "status": status,
+        "iq": iq_data,
+        "data_remaining": data_remaining.value,
+        "sample_loss": sample_loss.value,
+        "sec": sec.value,
+        "nano": nano.value
+    }
+
 @error_check
 def bb_fetch_audio(device):
     audio = numpy.zeros(4096).astype(numpy.float32)
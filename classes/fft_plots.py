@@ -0,0 +1,127 @@
+import numpy as np
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+'''
+Batch rendering of FFT spectra (same figures as BB60C_INTERFACE.plot_fft, without pyplot)
+
+plot_spectra(freqs, spectra, peaks_indxs, out_dir)   one fft_spectrum_<i>.png per spectrum, rendered by a
+                                                     process pool on the Agg canvas; every worker builds its
+                                                     figure once and only updates the line / marker data
+plot_summary(freqs, spectra, peaks_indxs, path)      a single figure instead: 'heatmap' (acquisition vs
+                                                     frequency) or 'panels' (one small plot per spectrum)
+'''
+
+logger = logging.getLogger("FFT_PLOTS")
+
+## below this many spectra the pool start up costs more than it saves
+MIN_PARALLEL = 16
+
+## per process figure, built by _SpectrumFigure on first use
+_figure = None
+
+
+class _SpectrumFigure:
+
+    def __init__(self, freqs):
+        self.freqs = freqs
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        (self.line,) = self.ax.plot(freqs, np.zeros(len(freqs)), label='FFT Spectrum')
+        self.marker = self.ax.scatter([freqs[0]], [0.0], color='red', marker='x', label='Peak Value')
+        self.ax.set_xlabel('Frequency (Hz)')
+        self.ax.set_ylabel('Power (dBm)')
+        self.title = self.ax.set_title('')
+        self.legend = self.ax.legend()
+
+    def render(self, index, spectrum, peak_indx, fig_path):
+        self.line.set_ydata(spectrum)
+        found = peak_indx >= 0
+        self.marker.set_visible(found)
+        self.legend.get_texts()[1].set_visible(found)
+        self.legend.legend_handles[1].set_visible(found)
+        if found:
+            self.marker.set_offsets([[self.freqs[peak_indx], spectrum[peak_indx]]])
+            self.legend.get_texts()[1].set_text(f'Peak Value = {spectrum[peak_indx]}')
+        self.title.set_text(f'FFT Spectrum #{index}')
+        finite = spectrum[np.isfinite(spectrum)]
+        if finite.size:
+            ## same margins as the autoscaled pyplot figure
+            low, high = finite.min(), finite.max()
+            pad = 0.05*(high - low) or 1.0
+            self.ax.set_ylim(low - pad, high + pad)
+        self.fig.savefig(fig_path)
+
+
+def _render(freqs, jobs):
+    ## jobs: [(index, spectrum, peak_indx, fig_path)], runs in a worker (or in process for small batches)
+    global _figure
+    if _figure is None or len(_figure.freqs) != len(freqs) or not np.array_equal(_figure.freqs, freqs):
+        _figure = _SpectrumFigure(freqs)
+    for job in jobs:
+        _figure.render(*job)
+    return [job[-1] for job in jobs]
+
+
+def plot_spectra(freqs, spectra, peaks_indxs, out_dir=None, indices=None, workers=None):
+    ## returns the paths of the PNGs, workers=None -> one per CPU, 1 -> no pool
+    freqs = np.asarray(freqs)
+    indices = range(len(spectra)) if indices is None else indices
+    jobs = [(i, np.asarray(spectra[i]), int(peaks_indxs[i]),
+             os.path.join(out_dir or '', f'fft_spectrum_{i}.png')) for i in indices]
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(1, len(jobs) // MIN_PARALLEL))
+    if workers == 1:
+        paths = _render(freqs, jobs)
+    else:
+        ## one batch per worker, each worker renders its batch on a single figure
+        batches = [jobs[k::workers] for k in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, [freqs]*workers, batches))
+        paths = [job[-1] for job in jobs]
+    logger.info(f'{len(paths)} FFT spectra plotted to {out_dir or "."} ({workers} workers)')
+    return paths
+
+
+def plot_summary(freqs, spectra, peaks_indxs, path, kind='heatmap', indices=None):
+    ## single figure of all spectra: 'heatmap' or 'panels'
+    freqs = np.asarray(freqs)
+    indices = np.arange(len(spectra)) if indices is None else np.asarray(indices)
+    spectra = np.asarray(spectra)[indices]
+    peaks_indxs = np.asarray(peaks_indxs)[indices]
+    found = peaks_indxs >= 0
+    if kind == 'heatmap':
+        fig = Figure(figsize=(8, max(4, 0.15*len(indices))))
+        ax = fig.add_subplot()
+        image = ax.imshow(spectra, aspect='auto', origin='lower', interpolation='nearest',
+                          extent=(freqs[0], freqs[-1], -0.5, len(indices) - 0.5))
+        ax.scatter(freqs[peaks_indxs[found]], np.flatnonzero(found), color='red', marker='x', s=10)
+        fig.colorbar(image, ax=ax, label='Power (dBm)')
+        ax.set_xlabel('Frequency (Hz)')
+        ax.set_ylabel('Acquisition')
+        ax.set_title('FFT Spectra')
+    elif kind == 'panels':
+        cols = math.ceil(math.sqrt(len(indices)))
+        rows = math.ceil(len(indices) / cols)
+        fig = Figure(figsize=(3*cols, 2.2*rows))
+        axes = fig.subplots(rows, cols, sharex=True, sharey=True, squeeze=False).ravel()
+        for ax, i, spectrum, peak_indx in zip(axes, indices, spectra, peaks_indxs):
+            ax.plot(freqs, spectrum, linewidth=0.6)
+            if peak_indx >= 0:
+                ax.scatter(freqs[peak_indx], spectrum[peak_indx], color='red', marker='x', s=10)
+            ax.set_title(f'#{i}', fontsize=8)
+        for ax in axes[len(indices):]:
+            ax.set_visible(False)
+        fig.supxlabel('Frequency (Hz)')
+        fig.supylabel('Power (dBm)')
+    else:
+        raise ValueError(f'Unknown summary kind {kind}')
+    FigureCanvasAgg(fig)
+    fig.savefig(path)
+    logger.info(f'{len(indices)} FFT spectra summarized ({kind}) in {path}')
+    return path
@@ -0,0 +1,156 @@
+import numpy as np
+import logging
+import time
+
+'''
+Fly scan: the gantry sweeps each row at a constant feed rate while the analyzer captures continuously.
+Each capture gets a position from its device timestamp and the commanded (trapezoidal) motion profile,
+and the captures are binned onto the grid points of the row.
+
+row sweep (one G1 move)
+|<- lead in ->|<-- bin 0 -->|<-- bin 1 -->| ... |<-- bin n-1 -->|<- lead out ->|
+  accelerating      constant velocity across all the bins            braking
+'''
+
+
+class TrapezoidalMove:
+    ## straight move from start to end at feed [mm/min] with constant acceleration accel [mm/s^2]
+    ## (triangular profile when the move is too short to reach the feed rate)
+
+    def __init__(self, start, end, feed, accel):
+        self.start = np.asarray(start, dtype=float)
+        self.end = np.asarray(end, dtype=float)
+        delta = self.end - self.start
+        self.length = float(np.linalg.norm(delta))
+        self.direction = delta / self.length if self.length > 0 else np.zeros(3)
+        self.accel = float(accel)
+        v = feed / 60.0
+        ## distance needed to reach v, limited to half the move
+        d_acc = min(v*v / (2*self.accel), self.length / 2)
+        self.v_max = np.sqrt(2*self.accel*d_acc)
+        self.t_acc = self.v_max / self.accel if self.accel > 0 else 0.0
+        self.t_cruise = (self.length - 2*d_acc) / self.v_max if self.v_max > 0 else 0.0
+        self.d_acc = d_acc
+        self.duration = 2*self.t_acc + self.t_cruise
+
+    def distance(self, t):
+        ## distance travelled [mm] t seconds after the start of the move (vectorized)
+        t = np.clip(np.asarray(t, dtype=float), 0, self.duration)
+        t_brake = t - self.t_acc - self.t_cruise
+        return np.where(t < self.t_acc, 0.5*self.accel*t*t,
+               np.where(t_brake <= 0, self.d_acc + self.v_max*(t - self.t_acc),
+                        self.length - 0.5*self.accel*(self.t_acc - t_brake)**2))
+
+    def position(self, t):
+        ## (len(t), 3) gantry coordinates t seconds after the start of the move
+        return self.start + np.multiply.outer(self.distance(t), self.direction)
+
+
+class FlyScan:
+    ## feed [mm/min] and accel [mm/s^2] must match the GRBL settings ($110-$112, $120-$122)
+    ## latency [s]: delay between sending the G1 line and the gantry starting to move
+    ## bin_fraction: fraction of each bin (centred on the grid point) whose captures are kept
+    ## max_per_bin: captures kept per grid point (default bb60c.num_captures, like a step scan),
+    ## evenly spread over the bin, so memory does not grow with the sweep time
+
+    def __init__(self, gantry, bb60c, feed=300.0, accel=50.0, latency=0.0, bin_fraction=1.0, settle=0.0, max_per_bin=None):
+        self.logger = logging.getLogger("FLY_SCAN")
+        self.gantry = gantry
+        self.bb60c = bb60c
+        self.feed = feed
+        self.accel = accel
+        self.latency = latency
+        self.bin_fraction = bin_fraction
+        self.settle = settle
+        self.max_per_bin = max_per_bin or bb60c.num_captures
+
+    def scan_row(self, first, step, num_points):
+        ## sweep num_points grid points first, first + step, ... and store one acquisition per point
+        ## returns the number of captures kept for each bin
+        first = np.asarray(first, dtype=float)
+        step = np.asarray(step, dtype=float)
+        step_len = float(np.linalg.norm(step))
+        direction = step / step_len
+        ## lead in/out: half a bin plus the acceleration distance, so every bin is at constant speed
+        v = self.feed / 60.0
+        margin = step_len/2 + v*v/(2*self.accel)
+        start = first - direction*margin
+        end = first + step*(num_points - 1) + direction*margin
+        move = TrapezoidalMove(start, end, self.feed, self.accel)
+
+        ## a bin lasts bin_fraction*step_len/v, captured back to back that is far more captures than
+        ## max_per_bin at any useful feed rate: only every stride-th one is kept, spread over the bin
+        capture_time = self.bb60c.samples_per_capture / self.bb60c.bandwidth
+        expected = self.bin_fraction*step_len / move.v_max / capture_time
+        stride = max(1, int(expected // self.max_per_bin))
+
+        ## go to the lead in point and wait there
+        self.gantry.move_to(*(float(c) for c in start))
+        self.gantry.send_command()
+        self.gantry.wait_until_idle(settle=self.settle)
+
+        ## start the sweep and capture until the move is over
+        self.gantry.move_to(*(float(c) for c in end))
+        t0 = time.time() + self.latency
+
+        def locate(timestamp):
+            ## bin of a capture (position at the centre of its capture window), -1 outside every bin
+            offset = (float(move.distance(timestamp + capture_time/2 - t0)) - margin) / step_len
+            b = int(np.rint(offset))
+            return b if abs(offset - b) <= self.bin_fraction/2 and 0 <= b < num_points else -1
+
+        self.gantry.protocol.send(self.gantry.format_move(*self.gantry.get_coordinates(), feed=self.feed))
+        binned, counts, seen, total = self._capture_until(t0 + move.duration, locate, num_points, stride)
+        self.gantry.wait_until_idle()
+
+        for b in range(num_points):
+            ## recorded at the grid point the bin is centred on
+            self.bb60c.process_acquisition(binned[b, :counts[b]], coords=first + b*step)
+        if np.any(seen == 0):
+            self.logger.warning(f'{np.sum(seen == 0)} empty bins, lower the feed rate')
+        self.logger.info(f'Row swept in {move.duration:.2f} s, {total} captures, {seen.min()}-{seen.max()} per bin, '
+                         f'{counts.min()}-{counts.max()} kept')
+        return counts
+
+    def scan_grid(self, origin, col_step, row_step, num_cols, num_rows, serpentine=True):
+        ## one sweep per row, every other row swept backwards when serpentine
+        ## acquisitions and the returned (num_rows, num_cols) capture counts are in sweep order
+        ## (same as scan_path.serpentine)
+        origin = np.asarray(origin, dtype=float)
+        col_step = np.asarray(col_step, dtype=float)
+        row_step = np.asarray(row_step, dtype=float)
+        counts = []
+        for r in range(num_rows):
+            first = origin + r*row_step
+            if serpentine and r % 2:
+                counts.append(self.scan_row(first + (num_cols - 1)*col_step, -col_step, num_cols))
+            else:
+                counts.append(self.scan_row(first, col_step, num_cols))
+        return np.array(counts)
+
+    def _capture_until(self, t_end, locate, num_points, stride):
+        ## continuous captures until the device time passes t_end, each one binned as soon as it is timestamped
+        ## a host that falls behind the stream keeps reading what the device buffered, only the device clock
+        ## ends the sweep (a device that reports no timestamp is timed by the host clock instead)
+        ## only (num_points, max_per_bin) captures are ever held, whatever the length of the sweep
+        capture_time = self.bb60c.samples_per_capture / self.bb60c.bandwidth
+        binned = np.empty((num_points, self.max_per_bin, self.bb60c.samples_per_capture), dtype=np.complex64)
+        counts = np.zeros(num_points, dtype=int) ## kept per bin
+        seen = np.zeros(num_points, dtype=int)   ## captured per bin
+        capture = np.empty((1, self.bb60c.samples_per_capture), dtype=np.complex64)
+        total = 0
+        purge = True
+        while True:
+            timestamp = self.bb60c.capture_timestamped(capture, purge=purge)[0]
+            purge = False
+            if timestamp <= 0:
+                timestamp = time.time() - capture_time
+            total += 1
+            b = locate(timestamp)
+            if b >= 0:
+                if seen[b] % stride == 0 and counts[b] < self.max_per_bin:
+                    binned[b, counts[b]] = capture[0]
+                    counts[b] += 1
+                seen[b] += 1
+            if timestamp > t_end:
+                return binned, counts, seen, total
@@ -2,19 +2,24 @@ import serial
 from serial.tools import list_ports
 import time
 import logging
+from classes.grbl_protocol import GrblProtocol, GrblAlarm
+from classes import timing
 
 class PrinterController:
 
     ## Constructor
-    def __init__(self):
+    ## port: serial port to use (e.g. a GrblSimulator pty), None looks for the Arduino
+    def __init__(self, port=None):
         ## Logging
         self.logger = logging.getLogger("PRINTER")
+        self.port = port
 
         ## Coordinates
         self.x_pos = 1
         self.y_pos = 1
         self.z_pos = 1
         self.ser_dev = None
+        self.protocol = None
     
     ################# Init Routines #################
 
@@ -30,53 +35,112 @@ class PrinterController:
     
     def set_steps_mm(self):
         self.logger.info('Setting correct values of [steps per mm]')
-        self.ser_dev.write("$100=6.25\n".encode()) ## x axis
-        time.sleep(1)
-        self.read_serial()
-        self.ser_dev.write("$101=6.25\n".encode()) ## y axis 
-        time.sleep(1)
-        self.read_serial()
-        self.ser_dev.write("$102=25\n".encode()) ## z axis 
-        time.sleep(1)
-        self.read_serial()
+        self.protocol.send("$100=6.25") ## x axis
+        self.protocol.send("$101=6.25") ## y axis 
+        self.protocol.send("$102=25") ## z axis 
         return 
     
-    def init_controller(self):
-        ## find the arduino
-        port = self.find_arduino()
+    def init_controller(self, confirm_origin=True):
+        ## find the arduino, unless a port was given
+        port = self.port or self.find_arduino()
         if not port:
             self.logger.error('Arduino not found')
             return False
-        ## open the serial port
-        self.ser_dev = serial.Serial(port, 115200, timeout=1)
-        time.sleep(2) ## wait for the serial port to open
+        ## open the serial port (short timeout, the reader thread polls it)
+        self.ser_dev = serial.Serial(port, 115200, timeout=0.1)
+        self.protocol = GrblProtocol(self.ser_dev, self.logger)
+        ## opening the port resets the arduino, wait for the GRBL banner
+        if not self.protocol.wait_for_banner(timeout=3.0):
+            self.logger.warning('No GRBL banner received, continuing anyway')
         self.logger.info('Serial Port Opened')
-        self.read_serial()
         
         ## remind user to manually set the printer to 0,0,0
-        _ = input('Is the printer in position 0,0?')
+        if confirm_origin:
+            _ = input('Is the printer in position 0,0?')
         self.send_command() ## init to position 1,1,1
-        self.read_serial()
         self.set_steps_mm() ## set correct steps per mm
         return True
 
+    def close_controller(self):
+        if self.protocol:
+            self.protocol.close()
+            self.protocol = None
+        if self.ser_dev:
+            self.ser_dev.close()
+            self.ser_dev = None
+
 
     ######### Serial communication routines #########
-    def read_serial(self):
-        while True:
-            resp = self.ser_dev.readline()
-            if not resp:
-                return ## done reading data from serial port
-            self.logger.info(resp)
+    @timing.timed('gantry.read_serial')
+    def read_serial(self, timeout=1.0):
+        ## responses are read and logged by the protocol reader thread
+        ## this only waits until every command sent so far is acknowledged
+        deadline = time.monotonic() + timeout
+        while self.protocol.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
     
+    @timing.timed('gantry.send_command')
     def send_command(self):
-        command = "G0 X" + str(self.x_pos) +" Y" +str(self.y_pos) + " Z" +str(self.z_pos) + '\n'
+        command = self.format_move(self.x_pos, self.y_pos, self.z_pos)
         self.logger.info('SENDING COMMAND: ' + command)
-        self.ser_dev.write(command.encode())
-        time.sleep(1)
-        self.read_serial()
+        ## returns as soon as GRBL acknowledges the move, raises GrblError on error:N / ALARM
+        self.protocol.send(command)
+        return
+
+    def format_move(self, x, y, z, feed=None):
+        ## G0 rapid move, or G1 at feed [mm/min] when a feed rate is given
+        if feed is None:
+            return "G0 X" + str(x) +" Y" +str(y) + " Z" +str(z)
+        return "G1 X" + str(x) +" Y" +str(y) + " Z" +str(z) + " F" + str(feed)
+
+    @timing.timed('gantry.run_program')
+    def run_program(self, lines, timeout=60.0):
+        ## stream a whole G-code program (character counting flow control)
+        self.logger.info(f'STREAMING PROGRAM ({len(lines)} lines)')
+        return self.protocol.stream(lines, timeout=timeout)
+
+    def stream_moves(self, points, feed=None, dwell=None):
+        ## stream a batch of (x, y, z) moves as one program
+        ## dwell [s]: optional G4 pause after every move
+        lines = []
+        for x, y, z in points:
+            lines.append(self.format_move(x, y, z, feed))
+            if dwell:
+                lines.append("G4 P" + str(dwell))
+        self.run_program(lines)
+        if len(points):
+            self.x_pos, self.y_pos, self.z_pos = points[-1]
         return
 
+    ############ Motion status routines ############
+    def get_status(self, timeout=2.0):
+        ## {'state': 'Idle', 'MPos': (x, y, z), ...} or None if no report arrived in time
+        return self.protocol.request_status(timeout)
+
+    @timing.timed('gantry.wait_until_idle')
+    def wait_until_idle(self, settle=0.0, timeout=120.0, poll_interval=0.05):
+        ## G4 P0 is only acknowledged once every queued move has finished
+        ## raises GrblError on error:N, GrblAlarm if GRBL reports an alarm, TimeoutError if it never stops
+        self.protocol.send('G4 P0', timeout=timeout)
+        ## then confirm with the status report
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.get_status()
+            if status and status['state'] == 'Idle':
+                break
+            if status and status['state'] == 'Alarm':
+                self.logger.critical('GRBL in alarm state, the gantry is locked')
+                raise GrblAlarm('status', 'G4 P0')
+            time.sleep(poll_interval)
+        else:
+            self.logger.error('Timed out waiting for the gantry to stop')
+            raise TimeoutError(f'Gantry not idle after {timeout} s')
+        ## optional mechanical settling time
+        if settle > 0:
+            with timing.stage('gantry.settle'):
+                time.sleep(settle)
+        return True
+
  
     ################# Movement Routines #################
     def move_up(self, num_steps):
@@ -109,14 +173,21 @@ class PrinterController:
         self.z_pos = self.z_pos - num_steps
         return
     
+    def move_to(self, x, y, z):
+        self.logger.info(f'MOVING TO {x},{y},{z}')
+        self.x_pos = x
+        self.y_pos = y
+        self.z_pos = z
+        return
+
     def finish_move(self):
         self.logger.critical('GOING TO 0,0,0')
         self.z_pos = 0
         self.send_command()
-        time.sleep(10)
+        self.wait_until_idle()
         self.y_pos = 0
         self.send_command()
-        time.sleep(10)
+        self.wait_until_idle()
         self.x_pos = 0
         self.send_command()
         return
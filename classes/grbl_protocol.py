@@ -0,0 +1,229 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from classes import timing
+
+
+class GrblError(Exception):
+    ## error:N answer to a command
+    def __init__(self, code, command=None):
+        self.code = code
+        self.command = command
+        super().__init__(f'GRBL error:{code}' + (f' for {command!r}' if command else ''))
+
+
+class GrblAlarm(GrblError):
+    ## ALARM:N, GRBL is locked until $X or a reset
+    def __init__(self, code, command=None):
+        super().__init__(code, command)
+        self.args = (f'GRBL ALARM:{code}' + (f' while waiting for {command!r}' if command else ''),)
+
+
+class GrblReset(GrblError):
+    ## the controller restarted (welcome banner) while commands were pending
+    def __init__(self, command=None):
+        super().__init__('reset', command)
+
+
+def parse_status(line):
+    ## <Idle|MPos:1.000,1.000,1.000|FS:0,0> -> {'state': 'Idle', 'MPos': (1.0, 1.0, 1.0), 'FS': (0.0, 0.0)}
+    fields = line.strip().strip('<>').split('|')
+    status = {'state': fields[0].split(':')[0]}
+    for field in fields[1:]:
+        key, _, value = field.partition(':')
+        try:
+            status[key] = tuple(float(v) for v in value.split(','))
+        except ValueError:
+            status[key] = value
+    return status
+
+
+class GrblProtocol:
+    ## Event driven GRBL serial link
+    ## A background thread reads and parses every line coming from the controller:
+    ## ok / error:N     -> acknowledges the oldest pending command (GRBL answers in order)
+    ## ALARM:N          -> fails every pending command
+    ## <...>            -> status report, resolves pending status requests
+    ## $N=value         -> settings echo, stored in self.settings
+    ## Grbl X.Y ...     -> welcome banner (controller reset)
+    ## anything else ([MSG:...], [GC:...], ...) is logged
+    ## Every line in flight is counted against the GRBL serial RX buffer (character counting),
+    ## stream() uses that to keep the RX buffer and planner full without overflowing them
+
+    RX_BUFFER_SIZE = 128
+
+    def __init__(self, ser_dev, logger=None):
+        self.logger = logger or logging.getLogger("GRBL")
+        self.ser_dev = ser_dev
+        self.settings = {}
+        self.last_status = None
+        self.banner = None
+
+        self._pending = deque()
+        self._status_waiters = []
+        self._banner_event = threading.Event()
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._inflight = 0
+        self._write_lock = threading.Lock()
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name='grbl-reader', daemon=True)
+        self._reader.start()
+
+    ######### Sending #########
+    def write(self, data):
+        with self._write_lock:
+            self.ser_dev.write(data)
+
+    def send_async(self, command, wait_for_space=False, timeout=None):
+        ## queue a line and return a Future resolved by its ok (or failed by error:N / ALARM)
+        ## wait_for_space: block until the line fits in the GRBL RX buffer (character counting)
+        command = command.strip()
+        data = (command + '\n').encode()
+        if len(data) >= self.RX_BUFFER_SIZE:
+            raise ValueError(f'Line longer than the GRBL RX buffer: {command!r}')
+        future = Future()
+        future.command = command
+        future.nbytes = len(data)
+        with self._space:
+            if wait_for_space:
+                if not self._space.wait_for(lambda: self._inflight + len(data) <= self.RX_BUFFER_SIZE - 1, timeout):
+                    raise TimeoutError(f'No room in the GRBL RX buffer for {command!r} after {timeout} s')
+            ## append and write under the same lock so the FIFO matches the wire order
+            self._pending.append(future)
+            self._inflight += len(data)
+            self.write(data)
+        return future
+
+    @timing.timed('grbl.send')
+    def send(self, command, timeout=60.0):
+        ## send a line and return as soon as its ok arrives, raise GrblError on error:N
+        future = self.send_async(command)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f'No acknowledgement for {command!r} after {timeout} s') from None
+
+    def stream(self, lines, timeout=60.0):
+        ## stream a G-code program with the character counting protocol:
+        ## a new line goes out as soon as the acknowledged lines free enough RX buffer space,
+        ## so GRBL always has the next moves queued and the planner can blend them
+        ## stops at the first error:N / ALARM and raises it, returns once every line is acknowledged
+        pending = deque()
+        sent = 0
+        for line in lines:
+            line = line.split(';')[0].strip() ## drop comments and blank lines
+            if not line:
+                continue
+            ## lines are acknowledged in order, so the finished ones are always at the front
+            while pending and pending[0].done():
+                future = pending.popleft()
+                if future.exception() is not None:
+                    raise future.exception()
+            pending.append(self.send_async(line, wait_for_space=True, timeout=timeout))
+            sent += 1
+        for future in pending:
+            try:
+                future.result(timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(f'No acknowledgement for {future.command!r} after {timeout} s') from None
+        return sent
+
+    @timing.timed('grbl.request_status')
+    def request_status(self, timeout=2.0):
+        ## '?' is a GRBL real-time command: no newline and no ok, answered with a status report
+        future = Future()
+        with self._lock:
+            self._status_waiters.append(future)
+        self.write(b'?')
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                if future in self._status_waiters:
+                    self._status_waiters.remove(future)
+            return None
+
+    def wait_for_banner(self, timeout=3.0):
+        ## GRBL prints its welcome banner once it is ready after a reset
+        return self._banner_event.wait(timeout)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        self._running = False
+        self._reader.join(timeout=1.0)
+        self._fail_pending(lambda cmd: GrblReset(cmd))
+
+    ######### Receiving #########
+    def _read_loop(self):
+        buf = b''
+        while self._running:
+            try:
+                chunk = self.ser_dev.read(self.ser_dev.in_waiting or 1)
+            except Exception as e:
+                if self._running:
+                    self.logger.error(f'Serial read failed: {e}')
+                    self._fail_pending(lambda cmd: GrblReset(cmd))
+                return
+            if not chunk:
+                continue
+            buf += chunk
+            while b'\n' in buf:
+                raw, buf = buf.split(b'\n', 1)
+                line = raw.decode(errors='ignore').strip()
+                if line:
+                    self._handle_line(line)
+
+    def _handle_line(self, line):
+        if line == 'ok':
+            self._ack(None)
+        elif line.startswith('error:'):
+            self._ack(line.partition(':')[2])
+        elif line.startswith('<'):
+            status = parse_status(line)
+            with self._lock:
+                self.last_status = status
+                waiters, self._status_waiters = self._status_waiters, []
+            for waiter in waiters:
+                waiter.set_result(status)
+        elif line.startswith('ALARM:'):
+            code = line.partition(':')[2]
+            self.logger.critical(line)
+            self._fail_pending(lambda cmd: GrblAlarm(code, cmd))
+        elif line.startswith('$') and '=' in line:
+            key, _, value = line.partition('=')
+            self.settings[key] = value
+        elif line.startswith('Grbl'):
+            self.logger.info(line)
+            self.banner = line
+            self._fail_pending(lambda cmd: GrblReset(cmd))
+            self._banner_event.set()
+        else:
+            self.logger.info(line)
+
+    def _ack(self, error_code):
+        with self._lock:
+            if not self._pending:
+                self.logger.warning(f'Unexpected acknowledgement ({"ok" if error_code is None else "error:" + error_code})')
+                return
+            future = self._pending.popleft()
+            self._inflight -= future.nbytes
+            self._space.notify_all()
+        if error_code is None:
+            future.set_result(True)
+        else:
+            self.logger.error(f'error:{error_code} for {future.command!r}')
+            future.set_exception(GrblError(error_code, future.command))
+
+    def _fail_pending(self, make_exc):
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+            self._inflight = 0
+            self._space.notify_all()
+        for future in pending:
+            if not future.done():
+                future.set_exception(make_exc(future.command))
@@ -0,0 +1,339 @@
+import numpy as np
+import fcntl
+import logging
+import os
+import re
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+from collections import deque
+from classes.fly_scan import TrapezoidalMove
+
+'''
+Simulated GRBL controller behind a serial-like object (write / read / in_waiting / close),
+so GrblProtocol and PrinterController run unchanged without a gantry.
+serve_pty() also exposes it as a pseudo-terminal, a real serial port for PrinterController(port=...).
+Opening the pseudo-terminal resets the controller like the DTR pulse resets the Arduino: the banner comes
+boot_time [s, real time] after a client connects or flushes its input (pyserial does both on open), so it is
+not lost to that flush.
+
+$N=value        stored, ok ($100-$102 steps/mm, $110-$112 max rates [mm/min], $120-$122 accelerations [mm/s^2])
+G0 / G1 X Y Z F queued in the planner (PLANNER_SIZE moves), ok as soon as there is room
+G4 P<s>         ok once every queued move is done and the dwell is over
+?               real-time status report <Idle|MPos:x,y,z|FS:0,0> (Run while moving), also during G4
+Ctrl-X          soft reset: planner flushed, welcome banner
+
+Moves are straight lines with a trapezoidal speed profile. Like GRBL, the speed and acceleration along
+the line are limited so no axis exceeds its own max rate ($11x) and acceleration ($12x); G1 is also
+limited by F. A line is answered after its serial transmission time at baudrate plus ok_latency,
+a status report comes status_latency after the '?' plus its own transmission time.
+time_scale > 1 runs the simulation (motion and latencies) faster than real time.
+'''
+
+MOVE_RE = re.compile(r'([XYZF])\s*(-?[\d.]+)')
+
+SOFT_RESET = b'\x18'
+
+
+class GrblSimulator:
+
+    PLANNER_SIZE = 15
+    BANNER = "Grbl 1.1h ['$' for help]"
+
+    def __init__(self, max_rates=(500.0, 500.0, 500.0), accelerations=(50.0, 50.0, 50.0), time_scale=1.0,
+                 position=(0.0, 0.0, 0.0), baudrate=115200, ok_latency=0.001, status_latency=0.005, timeout=0.1, boot_time=0.1):
+        self.logger = logging.getLogger("GRBL_SIM")
+        self.settings = {'$100': 250.0, '$101': 250.0, '$102': 250.0,
+                         '$110': max_rates[0], '$111': max_rates[1], '$112': max_rates[2],
+                         '$120': accelerations[0], '$121': accelerations[1], '$122': accelerations[2]}
+        self.time_scale = time_scale
+        self.baudrate = baudrate
+        self.ok_latency = ok_latency
+        self.status_latency = status_latency
+        self.timeout = timeout
+        self.boot_time = boot_time
+        self.position = np.asarray(position, dtype=float)
+        self.commands = 0 ## lines received
+
+        ## planner: (start time, TrapezoidalMove), times in simulated seconds
+        self._moves = deque()
+        self._busy_until = 0.0
+        self._t0 = time.monotonic()
+        self._rx = deque()
+        self._rx_buf = b''
+        self._status_requests = 0
+        self._tx = bytearray()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pty = None
+        self._worker = threading.Thread(target=self._run, name='grbl-sim', daemon=True)
+        self._realtime = threading.Thread(target=self._run_realtime, name='grbl-sim-rt', daemon=True)
+        self._worker.start()
+        self._realtime.start()
+        ## the in-process port is connected from the start
+        self._reply(self.BANNER)
+
+    ######### Serial interface #########
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._tx)
+
+    def write(self, data):
+        with self._cond:
+            for byte in data:
+                c = bytes([byte])
+                if c == b'?':
+                    ## real-time command, never buffered
+                    self._status_requests += 1
+                elif c == SOFT_RESET:
+                    self._reset()
+                elif c == b'\n':
+                    self._rx.append(self._rx_buf.decode(errors='ignore').strip())
+                    self._rx_buf = b''
+                elif c != b'\r':
+                    self._rx_buf += c
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1):
+        with self._cond:
+            self._cond.wait_for(lambda: self._tx or self._closed, self.timeout)
+            data = bytes(self._tx[:size])
+            del self._tx[:size]
+            return data
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout=1.0)
+        self._realtime.join(timeout=1.0)
+        if self._pty is not None:
+            os.close(self._pty)
+            self._pty = None
+
+    ######### Pseudo-terminal #########
+    def serve_pty(self):
+        ## bridge the simulator to a new pseudo-terminal and return the path of its serial port
+        master, slave = os.openpty()
+        ## raw: no echo and no newline translation, like a USB serial port
+        tty.setraw(slave)
+        port = os.ttyname(slave)
+        ## only clients hold the slave end, so the master sees them connect (no POLLHUP) and disconnect
+        os.close(slave)
+        self._pty = master
+        with self._cond:
+            ## nobody read the banner of the in-process port, a client gets its own on connect
+            self._tx.clear()
+        threading.Thread(target=self._pty_in, args=(master,), name='grbl-sim-pty-in', daemon=True).start()
+        threading.Thread(target=self._pty_out, args=(master,), name='grbl-sim-pty-out', daemon=True).start()
+        self.logger.info(f'Simulated GRBL on {port}')
+        return port
+
+    def _pty_in(self, master):
+        ## packet mode: every read starts with a status byte, 0 for data, TIOCPKT_FLUSHREAD when the client
+        ## flushed its input (pyserial does on open, so a quick close and reopen is seen even without a POLLHUP)
+        fcntl.ioctl(master, termios.TIOCPKT, struct.pack('i', 1))
+        poller = select.poll()
+        poller.register(master, select.POLLIN | select.POLLPRI)
+        connected = False
+        boot_at = None ## when the controller comes out of reset
+        while not self._closed:
+            wait = 50 if boot_at is None else max(0, 1000*(boot_at - time.monotonic()))
+            events = dict(poller.poll(wait)).get(master, 0)
+            if events & select.POLLHUP:
+                ## no client has the port open
+                connected = False
+                boot_at = None
+                time.sleep(0.01)
+                continue
+            if not connected:
+                connected = True
+                boot_at = time.monotonic() + self.boot_time
+            if events & (select.POLLIN | select.POLLPRI):
+                try:
+                    packet = os.read(master, 1025)
+                except OSError:
+                    continue
+                if packet[:1] == b'\x00':
+                    self.write(packet[1:])
+                elif packet and packet[0] & termios.TIOCPKT_FLUSHREAD:
+                    boot_at = time.monotonic() + self.boot_time
+            if boot_at is not None and time.monotonic() >= boot_at:
+                boot_at = None
+                self._boot()
+
+    def _boot(self):
+        ## opening the port pulses DTR, the Arduino reboots and GRBL prints its banner
+        with self._cond:
+            self._reset()
+            self._cond.notify_all()
+        self.logger.info('Client connected, controller reset')
+
+    def _pty_out(self, master):
+        while not self._closed:
+            data = self.read(1024)
+            if data:
+                try:
+                    os.write(master, data)
+                except OSError:
+                    return
+
+    ######### Simulated time #########
+    def now(self):
+        return (time.monotonic() - self._t0) * self.time_scale
+
+    def _sleep_until(self, t):
+        ## sleep (in simulated time) while the port stays open
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or self.now() >= t, max(0.0, (t - self.now()) / self.time_scale))
+
+    def _sleep(self, duration):
+        self._sleep_until(self.now() + duration)
+
+    def plan_move(self, start, end, feed=None):
+        ## TrapezoidalMove along the line, speed and acceleration limited per axis like GRBL
+        start = np.asarray(start, dtype=float)
+        end = np.asarray(end, dtype=float)
+        delta = np.abs(end - start)
+        length = float(np.linalg.norm(delta))
+        rates = np.array([self.settings[f'$11{i}'] for i in range(3)])
+        accels = np.array([self.settings[f'$12{i}'] for i in range(3)])
+        if length == 0:
+            return TrapezoidalMove(start, end, rates.min(), accels.min())
+        unit = delta / length
+        with np.errstate(divide='ignore'):
+            rate = float(np.min(np.where(unit > 0, rates / unit, np.inf)))
+            accel = float(np.min(np.where(unit > 0, accels / unit, np.inf)))
+        if feed:
+            rate = min(rate, feed)
+        return TrapezoidalMove(start, end, rate, accel)
+
+    def move_time(self, start, end, feed=None):
+        ## [s] from rest to rest
+        return self.plan_move(start, end, feed).duration
+
+    ######### Controller #########
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._rx or self._closed)
+                if self._closed:
+                    return
+                line = self._rx.popleft()
+            self.commands += 1
+            ## the line has to be received before GRBL parses it
+            self._sleep(self._serial_time(line) + self.ok_latency)
+            self._reply(self._execute(line))
+
+    def _run_realtime(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._status_requests or self._closed)
+                if self._closed:
+                    return
+                self._status_requests -= 1
+            self._sleep(self.status_latency)
+            with self._cond:
+                report = self._status()
+            self._sleep(self._serial_time(report))
+            self._reply(report)
+
+    def _serial_time(self, line):
+        ## 10 bits per character (8N1), newline included
+        return 10*(len(line) + 1) / self.baudrate
+
+    def _execute(self, line):
+        if not line:
+            return 'ok'
+        if line.startswith('$') and '=' in line:
+            key, _, value = line.partition('=')
+            try:
+                self.settings[key] = float(value)
+            except ValueError:
+                return 'error:3'
+            return 'ok'
+        word = line.split()[0].upper()
+        if word in ('G0', 'G00', 'G1', 'G01'):
+            return self._queue_move(line, feed_move=word in ('G1', 'G01'))
+        if word in ('G4', 'G04'):
+            match = re.search(r'P\s*([\d.]+)', line.upper())
+            self._sleep_until(max(self._busy_until, self.now()) + (float(match.group(1)) if match else 0.0))
+            return 'ok'
+        return 'error:20' ## unsupported command
+
+    def _queue_move(self, line, feed_move):
+        words = dict((k, float(v)) for k, v in MOVE_RE.findall(line.upper()))
+        with self._cond:
+            self._retire()
+            start = self._moves[-1][1].end if self._moves else self.position
+        end = start.copy()
+        for axis, key in enumerate('XYZ'):
+            if key in words:
+                end[axis] = words[key]
+        move = self.plan_move(start, end, words.get('F') if feed_move else None)
+        ## planner full: the ok only comes once the oldest move is done
+        while True:
+            with self._cond:
+                self._retire()
+                if len(self._moves) < self.PLANNER_SIZE:
+                    break
+                oldest_end = self._moves[0][0] + self._moves[0][1].duration
+            self._sleep_until(oldest_end)
+        with self._cond:
+            t_start = max(self._busy_until, self.now())
+            self._moves.append((t_start, move))
+            self._busy_until = t_start + move.duration
+        return 'ok'
+
+    def _retire(self):
+        now = self.now()
+        while self._moves and self._moves[0][0] + self._moves[0][1].duration <= now:
+            self.position = self._moves.popleft()[1].end
+
+    def _reset(self):
+        ## called with the condition held: stop where the gantry is, flush everything, banner
+        self._retire()
+        if self._moves:
+            t_start, move = self._moves[0]
+            self.position = move.position([self.now() - t_start])[0]
+        self._moves.clear()
+        self._busy_until = self.now()
+        self._rx.clear()
+        self._rx_buf = b''
+        self._tx += (self.BANNER + '\n').encode()
+
+    def _status(self):
+        ## called with the condition held
+        self._retire()
+        now = self.now()
+        position = self.position
+        state = 'Idle'
+        if self._moves:
+            t_start, move = self._moves[0]
+            if now >= t_start:
+                state = 'Run'
+                position = move.position([now - t_start])[0]
+        mpos = ','.join(f'{v:.3f}' for v in position)
+        return f'<{state}|MPos:{mpos}|FS:0,0>'
+
+    def _reply(self, line):
+        with self._cond:
+            self._tx += (line + '\n').encode()
+            self._cond.notify_all()
+
+
+if __name__ == "__main__":
+    ## python -m classes.grbl_sim: serve a simulated gantry until Ctrl-C
+    logging.basicConfig(level=logging.INFO)
+    sim = GrblSimulator()
+    print(sim.serve_pty())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.close()
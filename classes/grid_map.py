@@ -0,0 +1,162 @@
+import numpy as np
+import logging
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+'''
+Near-field maps from the gantry coordinates recorded with every acquisition
+
+assemble_grid(coords, values) -> GridMap
+|-> coords  (n, 3) gantry x, y, z per acquisition, in any order (serpentine, adaptive, repeated points)
+|           acquisitions without coordinates (NaN) are left out
+|-> values  (n,) e.g. peak power, or (n, ...) e.g. spectra, NaN where nothing was found
+|-> every axis is split into levels: points closer than tolerance [mm] are the same level, or with
+|   step [mm] the levels are a regular lattice from the smallest coordinate (missing rows stay empty)
+|-> axes with a single level are dropped (an X/Z scan at fixed Y gives a 2-D map)
+
+GridMap
+|-> values  (n_0, n_1[, n_2], ...) map indexed like axes, NaN where no acquisition landed
+|-> counts  acquisitions reduced into each cell
+|-> axes    coordinate of every level per axis, names ('x', 'z') ...
+|-> save(path) / GridMap.load(path)  single .npz, values stay an ndarray (np.load(path)['values'])
+|-> plot(path)                       heatmap (2-D, or one slice of a 3-D map)
+'''
+
+AXIS_NAMES = ('x', 'y', 'z')
+
+logger = logging.getLogger("GRID_MAP")
+
+
+def _levels(c, tolerance, step):
+    ## (level index of every coordinate, coordinate of every level)
+    if step is not None:
+        lowest = c.min()
+        indx = np.rint((c - lowest) / step).astype(int)
+        return indx, lowest + step*np.arange(indx.max() + 1)
+    order = np.argsort(c, kind='stable')
+    ## a new level wherever sorted coordinates jump by more than tolerance
+    level_of_sorted = np.concatenate(([0], np.cumsum(np.diff(c[order]) > tolerance)))
+    indx = np.empty(len(c), dtype=int)
+    indx[order] = level_of_sorted
+    n_levels = level_of_sorted[-1] + 1
+    return indx, np.bincount(indx, weights=c, minlength=n_levels) / np.bincount(indx, minlength=n_levels)
+
+
+def assemble_grid(coords, values, tolerance=0.05, step=None, reduce='mean', squeeze=True):
+    ## reduce: how repeated cells are combined, 'mean' / 'max' (NaN ignored) or 'last'
+    ## step: None, or [mm] for every axis (scalar) or per axis (x, y, z)
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    values = np.asarray(values, dtype=float)
+    if len(values) != len(coords):
+        raise ValueError(f'{len(values)} values for {len(coords)} coordinates')
+    valid = np.all(np.isfinite(coords), axis=1)
+    coords = coords[valid]
+    values = values[valid]
+    if not len(coords):
+        raise ValueError('No acquisition with coordinates')
+    steps = np.broadcast_to(np.asarray(step, dtype=object), (3,))
+
+    indices, axes, names = [], [], []
+    for a in range(3):
+        indx, levels = _levels(coords[:, a], tolerance, steps[a])
+        if squeeze and len(levels) == 1:
+            continue
+        indices.append(indx)
+        axes.append(levels)
+        names.append(AXIS_NAMES[a])
+    shape = tuple(len(levels) for levels in axes)
+    cell = np.ravel_multi_index(indices, shape) if indices else np.zeros(len(coords), dtype=int)
+    size = int(np.prod(shape))
+
+    flat = np.full((size,) + values.shape[1:], np.nan)
+    finite = np.isfinite(values)
+    counts = np.bincount(cell, minlength=size)
+    if reduce == 'mean':
+        sums = np.zeros_like(flat)
+        n = np.zeros(flat.shape)
+        np.add.at(sums, cell, np.where(finite, values, 0.0))
+        np.add.at(n, cell, finite)
+        np.divide(sums, n, out=flat, where=n > 0)
+    elif reduce == 'max':
+        np.fmax.at(flat, cell, values)
+    elif reduce == 'last':
+        ## acquisition order: the latest acquisition of a cell wins
+        flat[cell] = values
+    else:
+        raise ValueError(f'Unknown reduction {reduce}')
+    grid = GridMap(flat.reshape(shape + values.shape[1:]), counts.reshape(shape), axes, names)
+    missing = int(np.sum(grid.counts == 0))
+    logger.info(f'{len(coords)} acquisitions on a {"x".join(map(str, shape)) or "1"} {"/".join(names)} grid'
+                + (f', {missing} cells empty' if missing else ''))
+    return grid
+
+
+def grid_from_scan(scan, quantity='peaks', **kwargs):
+    ## scan: open_scan(path), ScanResult or anything with coords and the quantity ('peaks', 'spectra', ...)
+    return assemble_grid(scan.coords, getattr(scan, quantity), **kwargs)
+
+
+class GridMap:
+
+    def __init__(self, values, counts, axes, names):
+        self.values = values
+        self.counts = counts
+        self.axes = axes
+        self.names = tuple(names)
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def coordinates(self):
+        ## (shape..., n_axes) coordinate of every cell
+        return np.stack(np.meshgrid(*self.axes, indexing='ij'), axis=-1)
+
+    def save(self, path):
+        arrays = {'values': self.values, 'counts': self.counts, 'names': np.array(self.names)}
+        arrays.update({f'axis_{name}': levels for name, levels in zip(self.names, self.axes)})
+        np.savez(path, **arrays)
+        logger.info(f'{"x".join(map(str, self.shape))} map saved to {path}')
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            names = [str(name) for name in f['names']]
+            return cls(f['values'], f['counts'], [f[f'axis_{name}'] for name in names], names)
+
+    def plot(self, path, title='Peak Power', label='Power (dBm)', index=None):
+        ## 2-D heatmap (first axis horizontal), a 3-D map is plotted at level index of its last axis
+        ## (by default the level holding the maximum)
+        values = self.values
+        if values.ndim != len(self.axes):
+            raise ValueError('Only maps of one value per cell can be plotted')
+        if values.ndim == 3:
+            if index is None:
+                index = np.unravel_index(np.nanargmax(values), values.shape)[2]
+            values = values[..., index]
+            title = f'{title} ({self.names[2]} = {self.axes[2][index]:.2f} mm)'
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        if values.ndim == 1:
+            ax.plot(self.axes[0], values, marker='o')
+            ax.set_xlabel(f'{self.names[0]} (mm)')
+            ax.set_ylabel(label)
+        else:
+            mesh = ax.pcolormesh(_edges(self.axes[0]), _edges(self.axes[1]), values.T, shading='flat')
+            fig.colorbar(mesh, ax=ax, label=label)
+            ax.set_xlabel(f'{self.names[0]} (mm)')
+            ax.set_ylabel(f'{self.names[1]} (mm)')
+            ax.set_aspect('equal')
+        ax.set_title(title)
+        fig.savefig(path)
+        logger.info(f'Map plotted to {path}')
+        return path
+
+
+def _edges(levels):
+    ## cell edges halfway between levels (irregular spacing allowed)
+    if len(levels) == 1:
+        return np.array([levels[0] - 0.5, levels[0] + 0.5])
+    mid = (levels[1:] + levels[:-1]) / 2
+    return np.concatenate(([2*levels[0] - mid[0]], mid, [2*levels[-1] - mid[-1]]))
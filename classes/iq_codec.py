@@ -0,0 +1,140 @@
+import numpy as np
+import lzma
+import time
+import zlib
+
+'''
+Raw IQ encoding for storage (stdlib codecs only)
+
+codec       None (raw), 'zlib' or 'lzma', lossless on the (shuffled) bytes
+quantize    False: complex64 as is
+            True : int16 I/Q with one float32 scale per capture (lossy), scale = max(|I|, |Q|)/32767,
+                   so the quantization noise sits ~100 dB below the strongest sample of each capture
+
+Before compression the bytes are shuffled into planes (all first bytes, all second bytes, ...),
+float and int16 samples compress much better that way.
+encode(iq) -> bytes, decode(blob, shape) -> complex64 array of that shape
+'''
+
+CODECS = {
+    None: (lambda data, level: data, lambda data: data),
+    'zlib': (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=1 if level is None else level), lzma.decompress),
+}
+
+Q_MAX = 32767
+
+
+def check_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f'Unknown IQ codec {codec}')
+
+
+def _shuffle(arr):
+    return np.ascontiguousarray(arr.view(np.uint8).reshape(-1, arr.itemsize).T).tobytes()
+
+
+def _unshuffle(data, dtype):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+
+def quantize_iq(iq):
+    ## (..., n) complex64 -> (scales (...,) float32, (..., n, 2) int16)
+    iq = np.asarray(iq, dtype=np.complex64)
+    iq_f = iq.view(np.float32).reshape(iq.shape + (2,))
+    peak = np.abs(iq_f).max(axis=(-2, -1)) if iq.size else np.zeros(iq.shape[:-1], dtype=np.float32)
+    scales = np.where(peak > 0, peak / Q_MAX, 1.0).astype(np.float32)
+    q = np.rint(iq_f / scales[..., None, None]).astype(np.int16)
+    return scales, q
+
+
+def dequantize_iq(scales, q):
+    return (q.astype(np.float32) * scales[..., None, None]).view(np.complex64)[..., 0]
+
+
+def encode(iq, codec='zlib', quantize=False, level=None):
+    check_codec(codec)
+    iq = np.ascontiguousarray(iq, dtype=np.complex64)
+    if quantize:
+        scales, q = quantize_iq(iq)
+        raw = scales.tobytes() + _shuffle(q)
+    else:
+        raw = _shuffle(iq.view(np.float32))
+    return CODECS[codec][0](raw, level)
+
+
+def decode(blob, shape, codec='zlib', quantize=False):
+    check_codec(codec)
+    raw = CODECS[codec][1](bytes(blob))
+    shape = tuple(shape)
+    if quantize:
+        n_scales = int(np.prod(shape[:-1]))
+        scales = np.frombuffer(raw[:4*n_scales], dtype=np.float32).reshape(shape[:-1])
+        q = _unshuffle(raw[4*n_scales:], np.int16).reshape(shape + (2,))
+        return dequantize_iq(scales, q)
+    return _unshuffle(raw, np.float32).view(np.complex64).reshape(shape)
+
+
+class CodecStats:
+    ## running compression ratio and encode throughput of one save
+    def __init__(self):
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.seconds = 0.0
+
+    def encode(self, iq, codec='zlib', quantize=False, level=None):
+        t0 = time.perf_counter()
+        blob = encode(iq, codec, quantize, level)
+        self.seconds += time.perf_counter() - t0
+        self.raw_bytes += np.asarray(iq).size * np.dtype(np.complex64).itemsize
+        self.encoded_bytes += len(blob)
+        return blob
+
+    @property
+    def ratio(self):
+        return self.raw_bytes / self.encoded_bytes if self.encoded_bytes else 1.0
+
+    @property
+    def throughput(self):
+        ## [MB/s] of raw complex64 IQ encoded
+        return self.raw_bytes / 1e6 / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self):
+        return (f'raw IQ {self.raw_bytes/1e6:.1f} MB -> {self.encoded_bytes/1e6:.1f} MB '
+                f'(ratio {self.ratio:.2f}, {self.throughput:.0f} MB/s encode)')
+
+
+def encode_chunks(iq, codec='zlib', quantize=False, chunk_points=16, level=None, stats=None):
+    ## (n_points, ...) array -> dict for a pickle, points encoded chunk_points at a time
+    ## so a reader only has to decode the chunk of the point it needs
+    iq = np.asarray(iq, dtype=np.complex64)
+    stats = stats or CodecStats()
+    chunks = [stats.encode(iq[i:i + chunk_points], codec, quantize, level) for i in range(0, len(iq), chunk_points)]
+    return {'codec': codec, 'quantized': quantize, 'shape': iq.shape, 'chunk_points': chunk_points, 'chunks': chunks}
+
+
+class ChunkedIQ:
+    ## read side of encode_chunks, iq[i] decodes (and caches) the chunk of point i
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+        self.shape = tuple(encoded['shape'])
+        self._cached = (None, None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'point {i} out of range ({len(self)} points)')
+        k = self.encoded['chunk_points']
+        chunk = i // k
+        if self._cached[0] != chunk:
+            n = min(k, self.shape[0] - chunk*k)
+            data = decode(self.encoded['chunks'][chunk], (n,) + self.shape[1:],
+                          self.encoded['codec'], self.encoded['quantized'])
+            self._cached = (chunk, data)
+        return self._cached[1][i - chunk*k]
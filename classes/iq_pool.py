@@ -0,0 +1,31 @@
+import numpy as np
+import threading
+
+
+class IQBufferPool:
+    ## Pool of preallocated (num_captures, samples_per_capture) complex64 acquisition matrices.
+    ## Each row is C-contiguous, so it can be handed straight to bb_get_IQ_unpacked_into and
+    ## the IQ lands where the DSP reads it. Buffers given back with release() are reused.
+
+    def __init__(self, num_captures, samples_per_capture, max_free=8):
+        self.shape = (num_captures, samples_per_capture)
+        self.max_free = max_free
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        ## np.empty: no zero fill, every row is overwritten by the capture
+        return np.empty(self.shape, dtype=np.complex64)
+
+    def release(self, buf):
+        ## leading rows of a pooled matrix (adaptive dwell) give back the whole matrix
+        if buf is not None and buf.base is not None and buf.base.shape == self.shape:
+            buf = buf.base
+        if buf is None or buf.shape != self.shape or buf.dtype != np.complex64:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
@@ -0,0 +1,56 @@
+import numpy as np
+
+'''
+Vectorized peak search around a known bin (the expected harmonic) for a (n_spectra, n_fft) dB array
+window_peaks      -> strongest bin within +-half_width of center, one per spectrum, -1 if no real peak
+interpolate_peaks -> sub-bin offset and power from the two neighbours of the peak bin
+'''
+
+
+def window_peaks(spectra, center, half_width, min_prominence=1.0):
+    ## a peak must be a local maximum inside the window (not on its edges) and stand
+    ## min_prominence dB above the lowest bin on each side of it within the window
+    spectra = np.atleast_2d(spectra)
+    lo = max(center - half_width, 0)
+    hi = min(center + half_width + 1, spectra.shape[1])
+    window = spectra[:, lo:hi]
+    ## NaN spectra (nothing captured) never have a peak
+    valid = ~np.isnan(window).any(axis=1)
+    window = np.where(np.isnan(window), -np.inf, window)
+
+    rel = np.argmax(window, axis=1)
+    rows = np.arange(len(window))
+    peak_val = window[rows, rel]
+    cols = np.arange(window.shape[1])
+    left_min = np.where(cols[None, :] <= rel[:, None], window, np.inf).min(axis=1)
+    right_min = np.where(cols[None, :] >= rel[:, None], window, np.inf).min(axis=1)
+    with np.errstate(invalid='ignore'):
+        prominence = peak_val - np.maximum(left_min, right_min)
+
+    found = valid & (rel > 0) & (rel < window.shape[1] - 1) & (prominence >= min_prominence)
+    return np.where(found, rel + lo, -1)
+
+
+def interpolate_peaks(spectra, peak_indxs, method='parabolic'):
+    ## returns (offsets [bins], peak power [dB]) for every spectrum, (0, NaN) where peak_indxs is -1
+    ## 'parabolic': parabola through the linear magnitudes of the 3 bins around the peak
+    ## 'gaussian' : parabola through the dB values (a Gaussian in linear magnitude)
+    spectra = np.atleast_2d(spectra)
+    peak_indxs = np.asarray(peak_indxs)
+    found = (peak_indxs > 0) & (peak_indxs < spectra.shape[1] - 1)
+    idx = np.where(found, peak_indxs, 1)
+    rows = np.arange(len(spectra))
+    a, b, c = (spectra[rows, idx + k].astype(float) for k in (-1, 0, 1))
+    if method == 'parabolic':
+        a, b, c = (10**(v/20) for v in (a, b, c))
+    elif method != 'gaussian':
+        raise ValueError(f'Unknown interpolation {method}')
+
+    denom = a - 2*b + c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denom != 0, 0.5*(a - c)/denom, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+    peak = b - 0.25*(a - c)*offset
+    if method == 'parabolic':
+        peak = 20*np.log10(peak)
+    return np.where(found, offset, 0.0), np.where(found, peak, np.nan)
@@ -0,0 +1,145 @@
+import numpy as np
+import logging
+
+'''
+Scan path planning
+points are (N, 3) arrays of gantry (x, y, z) coordinates in mm
+orderings are index arrays into those points
+
+rect_grid   -> row major grid, rows of num_cols points
+polar_grid  -> rings of points around a centre
+serpentine  -> boustrophedon ordering of a grid (every other row reversed)
+nearest_neighbour + two_opt -> travel optimal ordering for sparse/arbitrary point sets
+'''
+
+logger = logging.getLogger("SCAN_PATH")
+
+## default per-axis max rates [mm/min] (GRBL $110, $111, $112)
+DEFAULT_FEED_RATES = (500.0, 500.0, 500.0)
+
+
+######### Point generators #########
+def rect_grid(origin, col_step, row_step, num_cols, num_rows):
+    ## origin, col_step, row_step are (x, y, z) vectors
+    ## e.g. harmonic_scan: col_step=(-6, 0, 0) (move right), row_step=(0, 0, 6) (table up)
+    origin = np.asarray(origin, dtype=float)
+    cols = np.arange(num_cols)[None, :, None] * np.asarray(col_step, dtype=float)
+    rows = np.arange(num_rows)[:, None, None] * np.asarray(row_step, dtype=float)
+    return (origin + rows + cols).reshape(-1, 3)
+
+
+def polar_grid(center, radii, num_angles, plane=(0, 2)):
+    ## rings of num_angles points (a single point for radius 0) in the plane of the two given axes
+    center = np.asarray(center, dtype=float)
+    points = []
+    for r in radii:
+        if r == 0:
+            points.append(center.copy())
+            continue
+        angles = np.linspace(0, 2*np.pi, num_angles, endpoint=False)
+        ring = np.repeat(center[None, :], num_angles, axis=0)
+        ring[:, plane[0]] += r*np.cos(angles)
+        ring[:, plane[1]] += r*np.sin(angles)
+        points.extend(ring)
+    return np.array(points).reshape(-1, 3)
+
+
+######### Orderings #########
+def raster(num_points):
+    return np.arange(num_points)
+
+
+def serpentine(num_cols, num_rows):
+    ## boustrophedon: odd rows are traversed backwards, no return stroke at the end of a row
+    order = np.arange(num_cols*num_rows).reshape(num_rows, num_cols)
+    order[1::2] = order[1::2, ::-1]
+    return order.ravel()
+
+
+def segment_times(points, feed_rates=DEFAULT_FEED_RATES):
+    ## GRBL moves all axes together, a segment lasts as long as its slowest axis needs [s]
+    points = np.asarray(points, dtype=float)
+    rates = np.asarray(feed_rates, dtype=float) / 60.0 ## mm/min -> mm/s
+    return np.max(np.abs(np.diff(points, axis=0)) / rates, axis=1)
+
+
+def pairwise_times(points, feed_rates=DEFAULT_FEED_RATES):
+    points = np.asarray(points, dtype=float)
+    rates = np.asarray(feed_rates, dtype=float) / 60.0
+    return np.max(np.abs(points[:, None, :] - points[None, :, :]) / rates, axis=2)
+
+
+def nearest_neighbour(points, start=0, feed_rates=DEFAULT_FEED_RATES):
+    ## greedy ordering: always travel to the closest (in time) unvisited point
+    cost = pairwise_times(points, feed_rates)
+    n = len(cost)
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=int)
+    current = start
+    for i in range(n):
+        order[i] = current
+        visited[current] = True
+        if i == n - 1:
+            break
+        candidates = np.where(visited, np.inf, cost[current])
+        current = int(np.argmin(candidates))
+    return order
+
+
+def two_opt(points, order=None, feed_rates=DEFAULT_FEED_RATES, max_passes=20):
+    ## improve an open path by reversing segments while that shortens the travel time
+    ## the first point is kept fixed (it is where the gantry starts)
+    cost = pairwise_times(points, feed_rates)
+    order = np.array(raster(len(cost)) if order is None else order)
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            ## gain of reversing order[i:j+1] for every j at once
+            c = order[i + 1:]
+            d = np.append(order[i + 2:], -1)
+            old = cost[a, b] + np.where(d >= 0, cost[c, d], 0)
+            new = cost[a, c] + np.where(d >= 0, cost[b, d], 0)
+            gain = old - new
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-9:
+                order[i:i + j + 2] = order[i:i + j + 2][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def travel_optimal(points, start=0, feed_rates=DEFAULT_FEED_RATES):
+    return two_opt(points, nearest_neighbour(points, start, feed_rates), feed_rates)
+
+
+######### Estimates #########
+def estimate_travel_time(points, order=None, feed_rates=DEFAULT_FEED_RATES, start=None):
+    ## total travel time [s] of visiting points in the given order (from start if given)
+    points = np.asarray(points, dtype=float)
+    if order is not None:
+        points = points[order]
+    if start is not None:
+        points = np.vstack([np.asarray(start, dtype=float), points])
+    if len(points) < 2:
+        return 0.0
+    return float(np.sum(segment_times(points, feed_rates)))
+
+
+######### Execution #########
+def run_path(gantry, points, order=None, on_point=None, settle=0.0):
+    ## drive a PrinterController through the points, calling on_point(index, point) at each stop
+    ## index is the position of the point in the (unordered) points array
+    ## returns the visited indices: the i-th stop (i.e. the i-th acquisition) was at points[order[i]]
+    points = np.asarray(points)
+    order = raster(len(points)) if order is None else np.asarray(order)
+    for indx in order:
+        x, y, z = (float(v) for v in points[indx])
+        gantry.move_to(x, y, z)
+        gantry.send_command()
+        gantry.wait_until_idle(settle=settle)
+        if on_point is not None:
+            on_point(int(indx), points[indx])
+    return order
@@ -0,0 +1,184 @@
+import numpy as np
+import json
+import os
+import pickle
+from classes.scan_storage import SCAN_EXT, META_FILE, FREQS_FILE, IQ_FILE, SPECTRA_FILE, INDEX_FILE
+from classes.iq_codec import ChunkedIQ, decode
+
+'''
+Reader for saved scans
+open_scan(path) works on both layouts and exposes the same attributes:
+|-> meta        dict of device settings and description
+|-> freqs       frequency axis (None if unknown)
+|-> spectra     (n_acquisitions, n_fft) averaged spectra
+|-> peaks       (n_acquisitions,) peak power, NaN where no peak was found
+|-> peaks_indxs (n_acquisitions,) peak bin, -1 where no peak was found
+|-> peak_offsets (n_acquisitions,) sub-bin offset of the peak (0 when not interpolated)
+|-> coords      (n_acquisitions, 3) gantry x, y, z, NaN when not recorded
+|-> n_captures  (n_acquisitions,) captures used per acquisition (varies with adaptive dwell)
+|-> iq          lazy raw IQ, iq[point] -> (n_captures, n_samples), iq[point, capture] -> (n_samples,)
+|               iq[start:stop] -> (points, max n_captures, n_samples), zero padded like ScanResult (see n_captures)
+
+.scan directories are memory mapped, nothing but the index is read until the data is accessed.
+Legacy .pkl files (save_data) have to be unpickled as a whole.
+Encoded raw IQ (iq_codec / iq_quantize, see iq_codec.py) is decoded when accessed, quantized IQ comes back as complex64.
+'''
+
+
+def open_scan(path):
+    if os.path.isdir(path) or os.path.isdir(path + SCAN_EXT):
+        return ScanDataset(path if os.path.isdir(path) else path + SCAN_EXT)
+    return LegacyScan(path)
+
+
+class IQAccessor:
+    ## indexes raw IQ per acquisition without loading the others
+    ## getter(i) returns the (n_captures, n_samples) array of acquisition i
+
+    def __init__(self, getter, length):
+        self._getter = getter
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        rest = ()
+        if isinstance(key, tuple):
+            key, rest = key[0], key[1:]
+        if isinstance(key, slice):
+            return self._padded([self._getter(i) for i in range(*key.indices(self._length))])[(slice(None),) + rest]
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError(f'acquisition {key} out of range ({self._length} acquisitions)')
+        return self._getter(key)[rest]
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._getter(i)
+
+    @staticmethod
+    def _padded(acquisitions):
+        ## acquisitions with fewer captures (adaptive dwell, dropped raw IQ) are zero padded to the widest one
+        if not acquisitions:
+            return np.empty((0, 0, 0), dtype=np.complex64)
+        rows = max(len(iq) for iq in acquisitions)
+        n_samples = max((iq.shape[-1] for iq in acquisitions if iq.ndim == 2), default=0)
+        padded = np.zeros((len(acquisitions), rows, n_samples), dtype=np.result_type(*acquisitions))
+        for i, iq in enumerate(acquisitions):
+            padded[i, :iq.shape[0], :iq.shape[-1]] = iq
+        return padded
+
+
+class ScanDataset:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        freqs_path = os.path.join(path, FREQS_FILE)
+        self.freqs = np.load(freqs_path) if os.path.exists(freqs_path) else None
+
+        ## a crash can leave a truncated last line, only complete lines are used
+        self.index = []
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            for line in f:
+                try:
+                    self.index.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+
+        n = len(self.index)
+        self.peaks = np.array([np.nan if e['peak'] is None else e['peak'] for e in self.index], dtype=float)
+        self.peaks_indxs = np.array([-1 if e['peak_indx'] is None else e['peak_indx'] for e in self.index], dtype=int)
+        self.peak_offsets = np.array([e.get('peak_offset', 0.0) for e in self.index], dtype=float)
+        self.coords = np.full((n, 3), np.nan)
+        for i, e in enumerate(self.index):
+            if e['coords'] is not None:
+                self.coords[i] = e['coords']
+        self.timestamps = np.array([np.nan if e['timestamp'] is None else e['timestamp'] for e in self.index], dtype=float)
+        self.n_captures = np.array([e['iq_shape'][0] if e['iq_shape'] else 0 for e in self.index], dtype=int)
+
+        ## encoded raw IQ: blobs of iq_nbytes bytes, decoded per acquisition
+        self._iq_encoding = self.meta.get('iq_encoding')
+        self._iq_map = self._memmap(IQ_FILE, np.dtype(np.uint8) if self._iq_encoding else np.dtype(self.meta['iq_dtype']))
+        spectra = self._memmap(SPECTRA_FILE, np.dtype(self.meta['spectrum_dtype']))
+        n_fft = self.index[0]['n_fft'] if n else 0
+        self.spectra = spectra[:n*n_fft].reshape(n, n_fft)
+        self.iq = IQAccessor(self._get_iq, n)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _memmap(self, name, dtype):
+        fn = os.path.join(self.path, name)
+        count = os.path.getsize(fn) // dtype.itemsize if os.path.exists(fn) else 0
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(fn, dtype=dtype, mode='r', shape=(count,))
+
+    def _get_iq(self, i):
+        entry = self.index[i]
+        if self._iq_encoding:
+            blob = self._iq_map[entry['iq_offset']:entry['iq_offset'] + entry['iq_nbytes']]
+            return decode(blob, entry['iq_shape'], self._iq_encoding['codec'], self._iq_encoding['quantized'])
+        start = entry['iq_offset'] // self._iq_map.itemsize
+        return self._iq_map[start:start + int(np.prod(entry['iq_shape']))].reshape(entry['iq_shape'])
+
+
+class LegacyScan:
+    ## pickle written by BB60C_INTERFACE.save_data
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        self.meta = {'Description': data.get('Description')}
+        self.freqs = None
+        self.spectra = np.array(data['fft_avg'])
+        raw_iq = data.get('raw_iq', [])
+        if isinstance(raw_iq, dict):
+            ## encoded with iq_codec.encode_chunks, decoded a chunk of points at a time
+            raw_iq = ChunkedIQ(raw_iq)
+        n = len(self.spectra)
+
+        self.peaks = np.array([np.nan if p is None else p for p in data['peaks']], dtype=float)
+        if len(data['peaks_indxs']) == len(self.peaks):
+            ## ScanResult layout: aligned, -1 where no peak was found
+            self.peaks_indxs = np.asarray(data['peaks_indxs'], dtype=int)
+        else:
+            ## older pickles: peaks hold None when nothing was found and peaks_indxs skips those entries
+            self.peaks_indxs = np.full(len(self.peaks), -1, dtype=int)
+            found = ~np.isnan(self.peaks)
+            self.peaks_indxs[found] = np.asarray(data['peaks_indxs'], dtype=int)[:np.sum(found)]
+        self.peak_offsets = np.asarray(data.get('peak_offsets', np.zeros(len(self.peaks))), dtype=float)
+        self.coords = np.asarray(data['coords'], dtype=float) if 'coords' in data else np.full((n, 3), np.nan)
+        self.timestamps = np.full(n, np.nan)
+        ## zero padded raw IQ is trimmed to the captures actually taken
+        n_captures = data.get('n_captures')
+        if n_captures is not None:
+            self.n_captures = np.asarray(n_captures, dtype=int)
+            ## points over the memory budget are read from the spill file, dropped ones are empty
+            spill = data.get('raw_iq_spill')
+            if spill is not None:
+                ## relative to the pickle (older pickles hold an absolute path)
+                spill_path = os.path.join(os.path.dirname(os.path.abspath(path)), spill['path'])
+            iq_shape = raw_iq.shape if isinstance(raw_iq, ChunkedIQ) else np.shape(raw_iq)
+            n_samples = iq_shape[-1] if len(iq_shape) == 3 else 0
+
+            def get_iq(i):
+                if spill is not None and i in spill['points']:
+                    offset, shape = spill['points'][i]
+                    return np.fromfile(spill_path, dtype=np.complex64, count=int(np.prod(shape)),
+                                       offset=offset).reshape(shape)
+                if i < len(raw_iq):
+                    return np.asarray(raw_iq[i])[:n_captures[i]]
+                return np.empty((0, n_samples), dtype=np.complex64)
+            self.iq = IQAccessor(get_iq, n)
+        else:
+            self.n_captures = np.array([len(acquisition) for acquisition in raw_iq], dtype=int)
+            self.iq = IQAccessor(lambda i: np.asarray(raw_iq[i]), len(raw_iq))
+
+    def __len__(self):
+        return len(self.spectra)
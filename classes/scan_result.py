@@ -0,0 +1,234 @@
+import numpy as np
+from classes.scan_storage import IQSpillFile
+
+'''
+ScanResult: one preallocated ndarray per quantity, grown geometrically (x2) when full
+
+iq          (n_points, n_captures, n_samples) complex64  raw IQ (optional, see keep_iq)
+n_captures  (n_points,) int                               captures actually stored per point
+spectra     (n_points, n_fft) float32                     averaged spectrum per point
+peaks_indxs (n_points,) int                               peak bin, -1 when no peak was found
+peaks       (n_points,) float                             peak power, NaN when no peak was found
+peak_offsets (n_points,) float                            sub-bin offset of the peak (0 without interpolation)
+coords      (n_points, 3) float                           gantry x, y, z, NaN when not recorded
+timestamps  (n_points,) float                             time the point was processed, NaN when not recorded
+
+The properties return views of the first n_points rows, so whole scan analytics are plain
+vectorized expressions, e.g. result.peaks[result.coords[:, 2] > 80].max()
+Acquisitions with fewer captures than the widest one are zero padded, n_captures tells them apart.
+With keep_iq=False the raw IQ is not stored (the iq rows of those points stay zero), everything else is.
+
+Bounded memory: with iq_budget [bytes] the resident raw IQ array never grows past the budget, counting
+the old array still alive while a grown copy is filled (so the resident array ends between half the
+budget and the whole of it). The raw IQ of the points after that is appended to a new spill file named
+after spill_path (spill_file, an existing file is never overwritten), or dropped when spill_path is None.
+Spectra, peaks and the other per point arrays always stay in memory.
+get_iq(point) reads spilled points back (None when dropped), iq is then a lazy IQAccessor.
+'''
+
+
+class ScanResult:
+
+    def __init__(self, n_fft, capacity=16, keep_iq=True, iq_budget=None, spill_path=None):
+        self.n_fft = n_fft
+        self.keep_iq = keep_iq
+        self.iq_budget = iq_budget
+        self.spill_path = spill_path
+        self.n_points = 0
+        self._capacity = capacity
+        self._spectra = np.full((capacity, n_fft), np.nan, dtype=np.float32)
+        self._peaks_indxs = np.full(capacity, -1, dtype=np.int64)
+        self._peaks = np.full(capacity, np.nan)
+        self._peak_offsets = np.zeros(capacity)
+        self._coords = np.full((capacity, 3), np.nan)
+        self._timestamps = np.full(capacity, np.nan)
+        self._n_captures = np.zeros(capacity, dtype=np.int64)
+        ## allocated on the first acquisition, once the capture shape is known
+        ## only the first n_resident points live in it, the others are spilled or dropped
+        self._iq = None
+        self.n_resident = 0
+        self._overflowing = False
+        self._spill = None
+        self._spilled = {} ## point -> (offset, shape) in the spill file
+
+    def __len__(self):
+        return self.n_points
+
+    ######### Views #########
+    @property
+    def spectra(self):
+        return self._spectra[:self.n_points]
+
+    @property
+    def peaks_indxs(self):
+        return self._peaks_indxs[:self.n_points]
+
+    @property
+    def peaks(self):
+        return self._peaks[:self.n_points]
+
+    @property
+    def peak_offsets(self):
+        return self._peak_offsets[:self.n_points]
+
+    @property
+    def coords(self):
+        return self._coords[:self.n_points]
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self.n_points]
+
+    @property
+    def n_captures(self):
+        return self._n_captures[:self.n_points]
+
+    @property
+    def iq(self):
+        if self._iq is None and not self._spilled:
+            return np.empty((self.n_points, 0, 0), dtype=np.complex64)
+        if self.n_resident < self.n_points:
+            ## some points are on disk (or dropped): index point by point
+            from classes.scan_reader import IQAccessor
+            ## nothing may be resident when the first acquisition was already over the budget
+            n_samples = self._iq.shape[2] if self._iq is not None else next(iter(self._spilled.values()))[1][-1]
+            empty = np.empty((0, n_samples), dtype=np.complex64)
+
+            def get(i):
+                iq = self.get_iq(i)
+                return empty if iq is None else iq
+            return IQAccessor(get, self.n_points)
+        return self._iq[:self.n_points]
+
+    @property
+    def resident_iq(self):
+        ## zero padded raw IQ of the points held in memory
+        if self._iq is None:
+            return np.empty((0, 0, 0), dtype=np.complex64)
+        return self._iq[:self.n_resident]
+
+    @property
+    def spilled(self):
+        ## {point: (offset, shape)} of the points whose raw IQ is in the spill file
+        return self._spilled
+
+    @property
+    def spill_file(self):
+        ## path of the spill file actually written, None until a point was spilled
+        return None if self._spill is None else self._spill.path
+
+    def get_iq(self, point):
+        ## raw IQ of one point without the zero padding, None when raw IQ is not kept
+        if point < 0:
+            point += self.n_points
+        if point in self._spilled:
+            return self._spill.read(*self._spilled[point])
+        if self._iq is None or point >= self.n_resident:
+            return None
+        return self._iq[point, :self._n_captures[point]]
+
+    @property
+    def overflowing(self):
+        ## True once the raw IQ budget was reached (later points are spilled or dropped)
+        return self._overflowing
+
+    def iq_nbytes(self):
+        ## memory held by the resident raw IQ
+        return 0 if self._iq is None else self._iq.nbytes
+
+    ######### Updates #########
+    def append(self, spectrum, iq=None, coords=None, timestamp=None):
+        ## store one acquisition and return its point index
+        if self.n_points == self._capacity:
+            self._grow(2*self._capacity)
+        i = self.n_points
+        self._spectra[i] = spectrum
+        if iq is not None:
+            iq = np.asarray(iq)
+            iq = iq.reshape(-1, iq.shape[-1]) if iq.size else iq.reshape(0, -1)
+            self._n_captures[i] = iq.shape[0]
+            if self.keep_iq:
+                self._store_iq(i, iq)
+        if coords is not None:
+            self._coords[i] = coords
+        if timestamp is not None:
+            self._timestamps[i] = timestamp
+        self.n_points += 1
+        return i
+
+    def set_peak(self, point, peak_indx, peak, offset=0.0):
+        self._peaks_indxs[point] = -1 if peak_indx is None else peak_indx
+        self._peaks[point] = np.nan if peak is None else peak
+        self._peak_offsets[point] = offset
+
+    def set_peaks(self, start, peak_indxs, peaks, offsets=0.0):
+        ## vectorized set_peak for the points start, start + 1, ...
+        stop = start + len(peak_indxs)
+        self._peaks_indxs[start:stop] = peak_indxs
+        self._peaks[start:stop] = peaks
+        self._peak_offsets[start:stop] = offsets
+
+    def clear(self):
+        self.close()
+        self.__init__(self.n_fft, keep_iq=self.keep_iq, iq_budget=self.iq_budget, spill_path=self.spill_path)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+    def _store_iq(self, i, iq):
+        n_rows, n_samples = iq.shape
+        if self._iq is not None and n_samples != self._iq.shape[2] and n_rows:
+            raise ValueError(f'Capture length {n_samples} does not match the scan ({self._iq.shape[2]})')
+        ## once a point went over the budget every later one does too, resident points stay 0..n_resident-1
+        if self._overflowing or not self._make_room(i, n_rows, n_samples):
+            self._overflowing = True
+            self._store_overflow(i, iq)
+            return
+        self._iq[i, :n_rows] = iq
+        self._iq[i, n_rows:] = 0
+        self.n_resident = i + 1
+
+    def _make_room(self, i, n_rows, n_samples):
+        ## grow (x2) and/or widen the resident array for point i within the budget
+        if self._iq is None:
+            rows, capacity = max(n_rows, 1), self._capacity
+        else:
+            rows, capacity = max(n_rows, self._iq.shape[1]), self._iq.shape[0]
+        while capacity <= i:
+            capacity *= 2
+        if self._iq is not None and self._iq.shape[:2] == (capacity, rows):
+            return True
+        point_bytes = max(rows*n_samples*np.dtype(np.complex64).itemsize, 1)
+        if self.iq_budget is not None:
+            ## the old array is only freed once the new one is filled, both count against the budget
+            held = self.iq_nbytes()
+            capacity = min(capacity, (self.iq_budget - held) // point_bytes)
+            if capacity <= i:
+                return False
+        new = np.zeros((capacity, rows, n_samples), dtype=np.complex64)
+        if self._iq is not None:
+            new[:self.n_resident, :self._iq.shape[1]] = self._iq[:self.n_resident]
+        self._iq = new
+        return True
+
+    def _store_overflow(self, i, iq):
+        if self.spill_path is None:
+            return
+        if self._spill is None:
+            self._spill = IQSpillFile(self.spill_path)
+        self._spilled[i] = self._spill.append(iq)
+
+    def _grow(self, capacity):
+        def grown(arr, fill):
+            new = np.full((capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            new[:len(arr)] = arr
+            return new
+        self._spectra = grown(self._spectra, np.nan)
+        self._peaks_indxs = grown(self._peaks_indxs, -1)
+        self._peaks = grown(self._peaks, np.nan)
+        self._peak_offsets = grown(self._peak_offsets, 0.0)
+        self._coords = grown(self._coords, np.nan)
+        self._timestamps = grown(self._timestamps, np.nan)
+        self._n_captures = grown(self._n_captures, 0)
+        self._capacity = capacity
@@ -0,0 +1,160 @@
+import numpy as np
+import json
+import logging
+import os
+from classes.iq_codec import CodecStats, check_codec
+
+'''
+Incremental on-disk scan format (one directory per scan, appended after every acquisition)
+
+<name>.scan/
+|-> meta.json     device settings, description, dtypes, iq_encoding (written once)
+|-> freqs.npy     frequency axis of the spectra
+|-> iq.bin        raw complex64 IQ of every acquisition, back to back
+                  (with iq_codec / iq_quantize one encoded blob per acquisition instead, see iq_codec.py)
+|-> spectra.bin   averaged spectrum of every acquisition, back to back
+|-> index.jsonl   one JSON line per acquisition:
+                  iq_offset/iq_shape into iq.bin (iq_nbytes when encoded), spectrum_offset into spectra.bin,
+                  peak_indx, peak, peak_offset (sub-bin), coords (gantry x, y, z), timestamp
+
+iq.bin and spectra.bin are raw arrays that can be opened with np.memmap using the offsets in the index.
+A line is only added to the index once the raw data it points to is flushed, so a crash mid scan
+leaves a readable scan with every completed acquisition.
+'''
+
+SCAN_EXT = '.scan'
+META_FILE = 'meta.json'
+FREQS_FILE = 'freqs.npy'
+IQ_FILE = 'iq.bin'
+SPECTRA_FILE = 'spectra.bin'
+INDEX_FILE = 'index.jsonl'
+FORMAT_VERSION = 1
+
+
+class ScanWriter:
+
+    def __init__(self, path, meta=None, freqs=None, iq_dtype=np.complex64, spectrum_dtype=np.float64, fsync=True,
+                 iq_codec=None, iq_quantize=False, iq_level=None):
+        self.logger = logging.getLogger("SCAN_WRITER")
+        if not path.endswith(SCAN_EXT):
+            path = path + SCAN_EXT
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f'{path} already holds a scan')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.iq_dtype = np.dtype(iq_dtype)
+        self.spectrum_dtype = np.dtype(spectrum_dtype)
+        self.fsync = fsync
+        self.num_acquisitions = 0
+        ## raw IQ encoding (lossless codec and/or int16 quantization), stats reported on close
+        check_codec(iq_codec)
+        self.iq_codec = iq_codec
+        self.iq_quantize = iq_quantize
+        self.iq_level = iq_level
+        self.encoded = iq_codec is not None or iq_quantize
+        self.codec_stats = CodecStats()
+
+        meta = dict(meta or {})
+        meta.update({'format_version': FORMAT_VERSION, 'iq_dtype': self.iq_dtype.str,
+                     'spectrum_dtype': self.spectrum_dtype.str})
+        if self.encoded:
+            meta['iq_encoding'] = {'codec': iq_codec, 'quantized': iq_quantize}
+        self._write_file(META_FILE, json.dumps(meta, indent=2, default=str).encode())
+        if freqs is not None:
+            np.save(os.path.join(path, FREQS_FILE), np.asarray(freqs))
+
+        self._iq = open(os.path.join(path, IQ_FILE), 'ab')
+        self._spectra = open(os.path.join(path, SPECTRA_FILE), 'ab')
+        self._index = open(os.path.join(path, INDEX_FILE), 'a')
+
+    def append(self, iq, spectrum, peak_indx=None, peak=None, coords=None, timestamp=None, peak_offset=0.0):
+        ## write one acquisition, returns its index in the scan
+        iq = np.ascontiguousarray(iq, dtype=self.iq_dtype)
+        spectrum = np.ascontiguousarray(spectrum, dtype=self.spectrum_dtype)
+        entry = {
+            'iq_offset': self._iq.tell(),
+            'iq_shape': list(iq.shape),
+            'spectrum_offset': self._spectra.tell(),
+            'n_fft': int(spectrum.size),
+            'peak_indx': None if peak_indx is None else int(peak_indx),
+            'peak': None if peak is None or np.isnan(peak) else float(peak),
+            'peak_offset': float(peak_offset),
+            'coords': None if coords is None else [float(c) for c in coords],
+            'timestamp': timestamp
+        }
+        ## raw data first, the index line last: the index never points at unwritten data
+        if self.encoded:
+            blob = self.codec_stats.encode(iq, self.iq_codec, self.iq_quantize, self.iq_level)
+            entry['iq_nbytes'] = len(blob)
+            self._iq.write(blob)
+        else:
+            iq.tofile(self._iq)
+        spectrum.tofile(self._spectra)
+        self._sync(self._iq)
+        self._sync(self._spectra)
+        self._index.write(json.dumps(entry) + '\n')
+        self._sync(self._index)
+        self.num_acquisitions += 1
+        return self.num_acquisitions - 1
+
+    def close(self):
+        for f in (self._iq, self._spectra, self._index):
+            if not f.closed:
+                f.close()
+        self.logger.info(f'{self.num_acquisitions} acquisitions saved to {self.path}')
+        if self.encoded and self.codec_stats.raw_bytes:
+            self.logger.info(self.codec_stats.summary())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _write_file(self, name, payload):
+        ## write to a temporary file then rename, so the file is either complete or absent
+        tmp = os.path.join(self.path, name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, name))
+
+
+class IQSpillFile:
+    ## Append-only raw IQ file for acquisitions that do not fit in memory (see ScanResult iq_budget)
+    ## append() returns the (offset, shape) to read the acquisition back with read()
+    ## an existing file (an earlier scan in the same directory) is never truncated:
+    ## path is raw_spill.iq, or raw_spill_1.iq, raw_spill_2.iq ... when that one exists
+
+    def __init__(self, path, dtype=np.complex64):
+        self.dtype = np.dtype(dtype)
+        stem, ext = os.path.splitext(path)
+        n = 0
+        while True:
+            try:
+                self._f = open(path, 'xb')
+                break
+            except FileExistsError:
+                n += 1
+                path = f'{stem}_{n}{ext}'
+        self.path = path
+
+    def append(self, iq):
+        iq = np.ascontiguousarray(iq, dtype=self.dtype)
+        offset = self._f.tell()
+        iq.tofile(self._f)
+        self._f.flush()
+        return offset, iq.shape
+
+    def read(self, offset, shape):
+        return np.fromfile(self.path, dtype=self.dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
@@ -0,0 +1,50 @@
+import numpy as np
+
+'''
+Synthetic IQ: a tone plus complex white noise, in the units of bbGetIQUnpacked (|x|^2 in mW)
+so the BB60C_INTERFACE spectra read the tone at power_dbm (flattop + 13.01 dB scaling).
+
+power_dbm   tone power [dBm]
+snr_db      tone power over the noise power per sample [dB]
+offset      tone frequency relative to the centre frequency [Hz]
+
+Captures are drawn from a bank generated once, so fill() costs a copy and does not
+skew DSP benchmarks with random number generation.
+'''
+
+
+class SyntheticIQ:
+
+    def __init__(self, samples_per_capture=4096, bandwidth=40.0e6, power_dbm=-60.0, snr_db=30.0, offset=0.0,
+                 bank_size=64, seed=0):
+        self.samples_per_capture = samples_per_capture
+        self.bandwidth = bandwidth
+        self.power_dbm = power_dbm
+        self.snr_db = snr_db
+        self.offset = offset
+        self._rng = np.random.default_rng(seed)
+        self._bank = self.generate(bank_size)
+        self._next = 0
+
+    def generate(self, num_captures, power_dbm=None):
+        ## (num_captures, samples_per_capture) complex64, random tone phase per capture
+        power_dbm = self.power_dbm if power_dbm is None else power_dbm
+        amplitude = 10**(power_dbm/20)
+        noise_std = amplitude / 10**(self.snr_db/20) / np.sqrt(2)
+        n = np.arange(self.samples_per_capture)
+        phase = self._rng.uniform(0, 2*np.pi, (num_captures, 1))
+        tone = amplitude*np.exp(1j*(2*np.pi*self.offset/self.bandwidth*n + phase))
+        noise = self._rng.standard_normal((num_captures, self.samples_per_capture, 2)) @ np.array([1, 1j])
+        return (tone + noise_std*noise).astype(np.complex64)
+
+    def fill(self, out, gain_db=0.0):
+        ## copy bank captures into out (e.g. a pooled acquisition matrix, or a contiguous block whose
+        ## length is a multiple of samples_per_capture), one bank capture per samples_per_capture samples
+        ## gain_db scales the whole capture (tone and noise), e.g. a spatial field model
+        out = out.reshape(-1, self.samples_per_capture)
+        for row in out:
+            row[:] = self._bank[self._next]
+            self._next = (self._next + 1) % len(self._bank)
+        if gain_db:
+            out *= np.float32(10**(gain_db/20))
+        return out
@@ -0,0 +1,123 @@
+import numpy as np
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+'''
+Lightweight per-stage timing (time.perf_counter, monotonic)
+
+TIMER (module default) collects one duration per call of each stage and plain counters:
+|-> stage('name')       context manager around a block
+|-> timed('name')       decorator for a function or method
+|-> count('name', n)    counter, e.g. 'points' (acquisitions processed)
+|-> summary()           {'wall_s', 'scan_s', 'points', 'points_per_minute', 'stages': {name: count, total_s,
+                          mean_ms, p50_ms, p90_ms, p99_ms, max_ms}, 'counters'}
+|-> save_json(path)     summary as JSON
+
+points_per_minute is the acquisition rate of the scan itself: points - 1 intervals over scan_s, the time from
+the first to the last 'points' count (i.e. process_acquisition), so whatever runs before or after the scan
+(setup, plotting, saving) does not dilute it. wall_s is the whole time since reset().
+
+Stages are inclusive (bb60c.capture_data also counts the bb60c.calc_fft inside it) and every bb_api call
+shows up as bb_api.<function>. Recording is thread safe, the pipeline threads time their stages too.
+'''
+
+logger = logging.getLogger("TIMING")
+
+
+class StageTimer:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._durations = {}
+            self._counters = {}
+            self._count_times = {} ## name -> [first, last] perf_counter of the count() calls
+            self.start_time = time.perf_counter()
+
+    def record(self, name, duration):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._durations.setdefault(name, []).append(duration)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            self._count_times.setdefault(name, [now, now])[1] = now
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def timed(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - t0)
+            return wrapper
+        return decorator
+
+    def summary(self, points=None):
+        ## points: number of grid points of the run (default: the 'points' counter)
+        with self._lock:
+            durations = {name: np.array(d) for name, d in self._durations.items()}
+            counters = dict(self._counters)
+            first, last = self._count_times.get('points', (0.0, 0.0))
+            wall = time.perf_counter() - self.start_time
+        stages = {}
+        for name, d in sorted(durations.items()):
+            p50, p90, p99 = np.percentile(d, (50, 90, 99)) * 1e3
+            stages[name] = {'count': int(d.size), 'total_s': float(d.sum()), 'mean_ms': float(d.mean() * 1e3),
+                            'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99),
+                            'max_ms': float(d.max() * 1e3)}
+        points = counters.get('points', 0) if points is None else points
+        scan = last - first
+        if points > 1 and scan > 0:
+            rate = 60.0 * (points - 1) / scan
+        else:
+            ## a single point has no interval, fall back to the whole run
+            rate = 60.0 * points / wall if wall > 0 else 0.0
+        return {'wall_s': wall, 'scan_s': scan, 'points': points, 'points_per_minute': rate,
+                'stages': stages, 'counters': counters}
+
+    def save_json(self, path, points=None):
+        summary = self.summary(points)
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f'Timing summary saved to {path}')
+        return summary
+
+    def report(self, points=None):
+        ## log the stages by total time, then the throughput
+        summary = self.summary(points)
+        for name, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_s']):
+            logger.info(f"{name}: {s['count']} calls, {s['total_s']:.3f} s total, "
+                        f"p50 {s['p50_ms']:.2f} ms, p90 {s['p90_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms")
+        logger.info(f"{summary['points']} points, scan {summary['scan_s']:.1f} s ({summary['points_per_minute']:.1f} points/min), "
+                    f"{summary['wall_s']:.1f} s in total")
+        return summary
+
+
+TIMER = StageTimer()
+stage = TIMER.stage
+timed = TIMER.timed
+count = TIMER.count
@@ -1,7 +1,9 @@
 import classes
-import time
 from classes.bb60c_class import BB60C_INTERFACE
 from classes.g_code_cntrl_class import PrinterController
+from classes import scan_path
+from classes.adaptive_scan import AdaptiveScan
+from classes import timing
 
 if __name__=="__main__":
     ## setup logging
@@ -22,52 +24,84 @@ if __name__=="__main__":
     if not gantry.init_controller():
         exit(-1)
     
+    ## time [s] to let the gantry stop vibrating once a move is done
+    settle_time = 0.5
+
     ## Move th gantry to the correct position 
     gantry.move_left(174) ## X position 1->174
     gantry.send_command()
-    time.sleep(30)
+    gantry.wait_until_idle(settle=settle_time)
     gantry.move_up(30) ## Y position 1->31
     gantry.send_command()
-    time.sleep(30)
+    gantry.wait_until_idle(settle=settle_time)
     gantry.table_up(74) ## Z position 1->75
     gantry.send_command()
-    time.sleep(30)
+    gantry.wait_until_idle(settle=settle_time)
     ## Start the scan
     step_inc = 6 ## each step is 6 mm (3x8 grid)
     num_rows = 8
     num_cols = 3
-    for _ in range(num_rows):
-        for _ in range(num_cols):
-            ## do an acquisition (i.e. 10 captures avg)
-            bb60c.capture_data()
-            ## move the gantry 6 mm to the right
-            gantry.move_right(step_inc)
-            gantry.send_command()
-            time.sleep(5)
-        ## reset x position to leftmost position
-        gantry.move_left(step_inc*num_cols)
-        gantry.send_command()
-        time.sleep(5)
-        ## move the gantry up 6 mm
-        gantry.table_up(step_inc)
-        gantry.send_command()
-        time.sleep(5)
+    ## grid points: columns go right (-x), rows go table up (+z)
+    ## serpentine order, no return stroke at the end of each row
+    grid = scan_path.rect_grid(gantry.get_coordinates(), (-step_inc, 0, 0), (0, 0, step_inc), num_cols, num_rows)
+    order = scan_path.serpentine(num_cols, num_rows)
+
+    def acquire(indx, point):
+        ## do an acquisition (i.e. 10 captures avg), tagged with where the gantry is
+        ## since the serpentine order is not the grid order
+        acquisition = bb60c.submit_capture(coords=gantry.get_coordinates())
+        ## only wait for the IQ to be captured before moving
+        acquisition.wait_captured()
+
+    ## adaptive=True: coarse grid first, then only the hot cells are refined down to 1.5 mm
+    adaptive = False
+    ## the <target>.scan directory written during the scan holds everything (open_scan reads it),
+    ## save_pickle=True also writes the legacy <target>.pkl at the end (raw IQ read back from the .scan)
+    save_pickle = False
+
+    ## per-stage timings cover the scan from here on
+    timing.TIMER.reset()
+
+    ## every acquisition is written to disk as soon as it is processed
+    bb60c.open_writer(target_comment)
+    ## FFT/peak processing runs in the background while the gantry moves
+    bb60c.start_pipeline()
+    if adaptive:
+        refine = AdaptiveScan(gantry, bb60c, power_threshold=-90.0, gradient_threshold=2.0, min_step=1.5, settle=settle_time)
+        refine.run(gantry.get_coordinates(), (-step_inc, 0, 0), (0, 0, step_inc), num_cols, num_rows)
+    else:
+        scan_path.run_path(gantry, grid, order, on_point=acquire, settle=settle_time)
+
+    ## wait for the pending acquisitions to be processed
+    bb60c.stop_pipeline()
+    bb60c.close_writer()
 
     ## get all peaks for FFTs 
     bb60c.get_fft_peaks()
 
-    ## save the data
-    bb60c.save_data(target_comment)
+    ## legacy pickle, only on request (the data is already in <target>.scan)
+    if save_pickle:
+        bb60c.save_data(target_comment)
 
     ## move the gantry to the origin
     gantry.finish_move()
     gantry.send_command()
+    gantry.wait_until_idle()
+    gantry.close_controller()
 
     ## close the device
     bb60c.close_device()
 
-    ## create plots ffts
-    for i in range(num_rows*num_cols):
-        bb60c.plot_fft(i)
+    ## create plots ffts (in parallel), summary='heatmap' for a single figure instead
+    bb60c.plot_ffts()
+
+    ## peak power on the X/Z grid, whatever order the points were scanned in
+    peak_map = bb60c.peak_map()
+    peak_map.save(name_dir + '/' + target_comment + '_map.npz')
+    peak_map.plot(name_dir + '/' + target_comment + '_map.png')
+
+    ## where the time went, and the scan throughput
+    timing.TIMER.report()
+    timing.TIMER.save_json(name_dir + '/' + target_comment + '_timing.json')
     
     print("Program Done...Bye!")
\ No newline at end of file
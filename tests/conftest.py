@@ -0,0 +1,25 @@
+import pytest
+
+
+class FakeGantry:
+    def __init__(self):
+        self.position = (0.0, 0.0, 0.0)
+        self.visited = []
+
+    def move_to(self, x, y, z):
+        self.position = (x, y, z)
+
+    def send_command(self):
+        self.visited.append(self.position)
+
+    def wait_until_idle(self, settle=0.0):
+        return True
+
+    def get_coordinates(self):
+        return self.position
+
+
+@pytest.fixture
+def fake_gantry():
+    ## PrinterController stand-in that moves instantly
+    return FakeGantry()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from classes.analyzer_backend import SimulatedBB60C
+from classes.bb60c_class import BB60C_INTERFACE
+
+
+@pytest.fixture
+def bb60c():
+    bb60c = BB60C_INTERFACE(num_captures=2, backend=SimulatedBB60C(realtime=False, seed=0))
+    bb60c.initialize_device()
+    yield bb60c
+    bb60c.close_device()
+
+
+def test_pipeline_processes_in_order(bb60c):
+    bb60c.start_pipeline()
+    handles = [bb60c.submit_capture(coords=(i, 0, 0)) for i in range(6)]
+    assert [handle.result(timeout=10) for handle in handles] == list(range(6))
+    bb60c.stop_pipeline()
+    np.testing.assert_array_equal(bb60c.result.coords[:, 0], np.arange(6))
+
+
+def track_buffers(bb60c, monkeypatch):
+    ## ids of every buffer the pool hands out
+    handed_out = set()
+    acquire = bb60c.iq_pool.acquire
+
+    def tracked():
+        buf = acquire()
+        handed_out.add(id(buf))
+        return buf
+    monkeypatch.setattr(bb60c.iq_pool, 'acquire', tracked)
+    return handed_out
+
+
+def test_failed_processing_returns_the_buffer(bb60c, monkeypatch):
+    def fail(acquisition, coords=None):
+        raise RuntimeError('DSP failed')
+    monkeypatch.setattr(bb60c, 'process_acquisition', fail)
+    handed_out = track_buffers(bb60c, monkeypatch)
+    bb60c.start_pipeline()
+    handles = [bb60c.submit_capture() for _ in range(3)]
+    for handle in handles:
+        with pytest.raises(RuntimeError):
+            handle.result(timeout=10)
+    bb60c.stop_pipeline()
+    assert {id(buf) for buf in bb60c.iq_pool._free} == handed_out
+
+
+def test_failed_capture_returns_the_buffer(bb60c, monkeypatch):
+    def fail(iq_data, purge=False):
+        raise OSError('device gone')
+    monkeypatch.setattr(bb60c.backend, 'get_IQ_into', fail)
+    with pytest.raises(OSError):
+        bb60c.capture_raw()
+    assert len(bb60c.iq_pool._free) == 1
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from classes.analyzer_backend import SimulatedBB60C
+from classes.bb60c_class import BB60C_INTERFACE
+
+
+def dwell_bb60c(power_dbm):
+    backend = SimulatedBB60C(field=lambda x, y, z: power_dbm, realtime=False, seed=0)
+    bb60c = BB60C_INTERFACE(num_captures=20, dwell='adaptive', min_captures=2, target_ci=0.5, peak_window=8,
+                            backend=backend)
+    bb60c.initialize_device()
+    return bb60c
+
+
+def test_strong_harmonic_stops_early():
+    bb60c = dwell_bb60c(-40.0)
+    bb60c.capture_data()
+    bb60c.close_device()
+    assert bb60c.result.n_captures[0] == 2
+    assert bb60c.peaks[0] == pytest.approx(-40.0, abs=0.5)
+
+
+def test_noise_uses_every_capture():
+    bb60c = dwell_bb60c(-200.0)
+    bb60c.capture_data()
+    bb60c.close_device()
+    assert bb60c.result.n_captures[0] == 20
+
+
+def test_saved_captures_are_trimmed(tmp_path):
+    from classes.scan_reader import open_scan
+    bb60c = dwell_bb60c(-40.0)
+    bb60c.set_dir(str(tmp_path))
+    bb60c.capture_data()
+    bb60c.capture_data()
+    bb60c.close_device()
+    bb60c.save_data('dwell')
+    scan = open_scan(str(tmp_path / 'dwell.pkl'))
+    np.testing.assert_array_equal(scan.n_captures, [2, 2])
+    assert scan.iq[1].shape == (2, bb60c.samples_per_capture)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from classes.adaptive_scan import AdaptiveScan
+from classes.analyzer_backend import SimulatedBB60C, gaussian_spot
+from classes.bb60c_class import BB60C_INTERFACE
+
+
+@pytest.fixture
+def bb60c(fake_gantry):
+    ## hot spot at (13, 0, 13), floor well under the power threshold
+    field = gaussian_spot((13.0, 0.0, 13.0), peak_dbm=-50.0, width=4.0, floor_dbm=-140.0)
+    bb60c = BB60C_INTERFACE(num_captures=2, peak_window=8,
+                            backend=SimulatedBB60C(field, fake_gantry.get_coordinates, realtime=False, seed=0))
+    bb60c.initialize_device()
+    bb60c.start_pipeline()
+    yield bb60c
+    bb60c.stop_pipeline()
+    bb60c.close_device()
+
+
+def test_refines_only_around_the_hot_spot(fake_gantry, bb60c):
+    scan = AdaptiveScan(fake_gantry, bb60c, power_threshold=-80.0, min_step=1.5)
+    lattice, positions, indices = scan.run((0, 0, 0), (6, 0, 0), (0, 0, 6), 5, 5)
+    ## 4 levels of 6 mm -> 1.5 mm, far fewer points than the 17 x 17 uniform grid
+    assert scan.scale == 4
+    assert 25 < len(lattice) < 17*17
+    ## every coarse point, plus points at the finest step next to the spot
+    coarse = {(c*4, r*4) for r in range(5) for c in range(5)}
+    assert coarse <= {tuple(p) for p in lattice}
+    assert np.min(np.linalg.norm(positions - (13.0, 0.0, 13.0), axis=1)) <= 1.5*np.sqrt(2)/2 + 1e-9
+    ## refined points only in cells with a corner above -80 dBm (< 7.4 mm from the spot)
+    fine = np.any(lattice % 4 != 0, axis=1)
+    assert np.all(np.linalg.norm(positions[fine] - (13.0, 0.0, 13.0), axis=1) < 7.4 + 6*np.sqrt(2))
+    assert not np.any(fine & (positions[:, 0] < 6) & (positions[:, 2] < 6))
+    ## each point has its own acquisition, recorded where it was measured
+    assert sorted(indices) == list(range(len(indices)))
+    np.testing.assert_allclose(bb60c.result.coords[indices], positions)
+
+
+def test_needs_a_threshold(fake_gantry, bb60c):
+    with pytest.raises(ValueError):
+        AdaptiveScan(fake_gantry, bb60c)
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from classes.bb60c_class import BB60C_INTERFACE
+
+
+## float32: bins ~100 dB under the tone are only good to a few 0.01 dB (see dsp_dtype)
+@pytest.mark.parametrize('dsp_dtype, atol', [(np.float64, 1e-6), (np.float32, 0.05)])
+def test_band_matches_fft_bins(dsp_dtype, atol):
+    rng = np.random.default_rng(0)
+    n = np.arange(4096)
+    captures = (1e-3*np.exp(2j*np.pi*3.3*n/4096)
+                + 1e-5*(rng.standard_normal((5, 4096)) + 1j*rng.standard_normal((5, 4096)))).astype(np.complex64)
+    full = BB60C_INTERFACE(num_captures=5, dsp_dtype=dsp_dtype)
+    band = BB60C_INTERFACE(num_captures=5, estimator='band', band_bins=8, dsp_dtype=dsp_dtype)
+    c = full.center_indx
+    np.testing.assert_allclose(band.calc_fft(captures), full.calc_fft(captures)[c - 8:c + 9], atol=atol)
+    np.testing.assert_array_equal(band.freqs, full.freqs[c - 8:c + 9])
+    assert band.center_indx == 8
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from scipy.fft import fft, fftshift
+from classes.bb60c_class import BB60C_INTERFACE
+
+
+def reference_fft(bb60c, acquisition):
+    ## per-capture loop calc_fft was written as before batching
+    spectra = [20*np.log10(np.abs(fftshift(fft(capture * bb60c.window)))/bb60c.samples_per_capture) + 13.01
+               for capture in acquisition]
+    return np.mean(spectra, axis=0)
+
+
+@pytest.fixture
+def acquisition():
+    rng = np.random.default_rng(0)
+    shape = (10, 4096)
+    n = np.arange(shape[1])
+    tone = 1e-3*np.exp(2j*np.pi*0.01*n)
+    return (tone + 1e-5*(rng.standard_normal(shape) + 1j*rng.standard_normal(shape))).astype(np.complex64)
+
+
+def test_batched_fft_matches_per_capture_loop(acquisition):
+    bb60c = BB60C_INTERFACE(num_captures=10)
+    np.testing.assert_allclose(bb60c.calc_fft(acquisition), reference_fft(bb60c, acquisition), atol=1e-9)
+
+
+def test_fewer_captures_reuse_buffers(acquisition):
+    ## buffers sized for 10 captures, then used for 3
+    bb60c = BB60C_INTERFACE(num_captures=10)
+    bb60c.calc_fft(acquisition)
+    np.testing.assert_allclose(bb60c.calc_fft(acquisition[:3]), reference_fft(bb60c, acquisition[:3]), atol=1e-9)
+
+
+def test_empty_acquisition_is_nan():
+    bb60c = BB60C_INTERFACE(num_captures=10)
+    assert np.all(np.isnan(bb60c.calc_fft(np.empty((0, 4096), dtype=np.complex64))))
+
+
+## the float32 bounds documented with dsp_dtype: (peak, bins >= 10 dB over the noise floor, every bin) [dB]
+@pytest.mark.parametrize('estimator, bounds', [('fft', (1e-4, 1e-4, 0.02)), ('band', (1e-3, 5e-3, 0.2))])
+def test_float32_matches_float64(estimator, bounds):
+    from classes.synthetic_iq import SyntheticIQ
+    full = BB60C_INTERFACE(num_captures=10)
+    f64 = BB60C_INTERFACE(num_captures=10, estimator=estimator)
+    f32 = BB60C_INTERFACE(num_captures=10, estimator=estimator, dsp_dtype=np.float32)
+    for seed in range(5):
+        for snr_db in (10, 20, 30, 40):
+            acquisition = SyntheticIQ(snr_db=snr_db, offset=3.3e4, seed=seed).generate(10)
+            floor = np.median(full.calc_fft(acquisition))
+            reference = f64.calc_fft(acquisition)
+            spectrum = f32.calc_fft(acquisition)
+            assert spectrum.dtype == np.float32
+            error = np.abs(spectrum - reference)
+            assert error[np.argmax(reference)] < bounds[0]
+            assert error[reference - floor >= 10].max() < bounds[1]
+            assert error.max() < bounds[2]
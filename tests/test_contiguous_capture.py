@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from classes.analyzer_backend import SimulatedBB60C
+from classes.bb60c_class import BB60C_INTERFACE
+
+N = 4096
+
+
+@pytest.mark.parametrize('overlap, count, hop', [(0.0, 4, N), (0.5, 7, N // 2)])
+def test_segments(overlap, count, hop):
+    bb60c = BB60C_INTERFACE(capture_mode='contiguous', contiguous_samples=4*N, segment_overlap=overlap)
+    block = np.arange(4*N).astype(np.complex64)
+    segments = bb60c.get_segments(block)
+    assert segments.shape == (count, N)
+    np.testing.assert_array_equal(segments[:, 0].real, hop*np.arange(count))
+    np.testing.assert_array_equal(segments[-1], block[(count - 1)*hop:(count - 1)*hop + N])
+
+
+@pytest.mark.parametrize('overlap, count', [(0.0, 4), (0.5, 7)])
+def test_partial_segment_is_left_out(overlap, count):
+    ## 1000 samples past the last whole segment
+    bb60c = BB60C_INTERFACE(capture_mode='contiguous', contiguous_samples=4*N + 1000, segment_overlap=overlap)
+    assert bb60c.iq_pool.acquire().shape == (1, 4*N + 1000)
+    assert len(bb60c.get_segments(np.zeros(4*N + 1000, dtype=np.complex64))) == count
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        BB60C_INTERFACE(capture_mode='contiguous', contiguous_samples=N - 1)
+    with pytest.raises(ValueError):
+        BB60C_INTERFACE(capture_mode='contiguous', segment_overlap=1.0)
+    with pytest.raises(ValueError):
+        BB60C_INTERFACE(capture_mode='burst')
+
+
+@pytest.mark.parametrize('overlap', [0.0, 0.5])
+def test_contiguous_matches_captures_on_a_tone(overlap):
+    spectra = []
+    for mode in ('captures', 'contiguous'):
+        bb60c = BB60C_INTERFACE(num_captures=8, capture_mode=mode, segment_overlap=overlap,
+                                backend=SimulatedBB60C(tones=((1e6, 0.0),), realtime=False, seed=0))
+        bb60c.initialize_device()
+        bb60c.capture_data()
+        bb60c.close_device()
+        spectra.append(bb60c.fft_data[0])
+    captures, contiguous = spectra
+    peak = int(np.argmax(captures))
+    assert np.argmax(contiguous) == peak
+    ## the tone and its window main lobe
+    np.testing.assert_allclose(contiguous[peak - 2:peak + 3], captures[peak - 2:peak + 3], atol=0.05)
+    ## the noise floor away from the tone
+    assert np.median(contiguous) == pytest.approx(np.median(captures), abs=0.5)
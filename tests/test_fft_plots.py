@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pytest
+from classes import fft_plots
+
+
+def spectra(n, n_fft=64):
+    rng = np.random.default_rng(0)
+    return -100 + rng.standard_normal((n, n_fft)), np.arange(n_fft)*1e3
+
+
+def test_plot_spectra_in_process(tmp_path):
+    data, freqs = spectra(3)
+    peaks_indxs = np.array([10, -1, 20])
+    paths = fft_plots.plot_spectra(freqs, data, peaks_indxs, str(tmp_path), workers=1)
+    assert paths == [str(tmp_path / f'fft_spectrum_{i}.png') for i in range(3)]
+    assert all(os.path.getsize(path) > 0 for path in paths)
+    ## the figure is reused, the last spectrum had a peak
+    figure = fft_plots._figure
+    assert figure.marker.get_visible()
+    assert figure.legend.get_texts()[1].get_text() == f'Peak Value = {data[2, 20]}'
+
+
+def test_missing_peak_hides_marker_and_legend(tmp_path):
+    data, freqs = spectra(2)
+    fft_plots.plot_spectra(freqs, data, [10, -1], str(tmp_path), workers=1)
+    figure = fft_plots._figure
+    assert not figure.marker.get_visible()
+    assert not figure.legend.get_texts()[1].get_visible()
+    assert not figure.legend.legend_handles[1].get_visible()
+
+
+def test_plot_spectra_on_a_pool(tmp_path):
+    ## enough spectra for two workers
+    data, freqs = spectra(2*fft_plots.MIN_PARALLEL)
+    peaks_indxs = np.where(np.arange(len(data)) % 3, 5, -1)
+    paths = fft_plots.plot_spectra(freqs, data, peaks_indxs, str(tmp_path), indices=range(0, len(data), 2), workers=2)
+    assert len(paths) == len(data) // 2
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+
+
+@pytest.mark.parametrize('kind', ['heatmap', 'panels'])
+def test_plot_summary(tmp_path, kind):
+    data, freqs = spectra(5)
+    path = str(tmp_path / f'{kind}.png')
+    assert fft_plots.plot_summary(freqs, data, [3, -1, 3, 4, -1], path, kind) == path
+    assert os.path.getsize(path) > 0
+
+
+def test_unknown_summary_kind(tmp_path):
+    data, freqs = spectra(2)
+    with pytest.raises(ValueError):
+        fft_plots.plot_summary(freqs, data, [1, 1], str(tmp_path / 'x.png'), 'waterfall')
@@ -0,0 +1,72 @@
+import numpy as np
+import time
+import pytest
+from classes.analyzer_backend import SimulatedBB60C
+from classes.bb60c_class import BB60C_INTERFACE
+from classes.fly_scan import FlyScan, TrapezoidalMove
+from classes.g_code_cntrl_class import PrinterController
+from classes.grbl_protocol import GrblProtocol
+from classes.grbl_sim import GrblSimulator
+
+
+def test_trapezoidal_move_profile():
+    move = TrapezoidalMove((0, 0, 0), (30, 0, 0), feed=600.0, accel=50.0)
+    ## 10 mm/s reached after 0.2 s and 1 mm
+    assert move.v_max == pytest.approx(10.0)
+    assert move.duration == pytest.approx(0.2 + 2.8 + 0.2)
+    np.testing.assert_allclose(move.distance([0.0, 0.2, 1.2, move.duration, 10.0]), [0.0, 1.0, 11.0, 30.0, 30.0])
+
+
+def test_triangular_profile():
+    move = TrapezoidalMove((0, 0, 0), (0, 0, 2), feed=6000.0, accel=50.0)
+    assert move.t_cruise == 0.0
+    assert move.position([move.duration])[0] == pytest.approx([0.0, 0.0, 2.0])
+
+
+def test_captures_per_bin_are_bounded():
+    ## the stream is not paced (realtime=False): its timestamps only depend on the samples read, so the
+    ## binning does not depend on how fast this host keeps up
+    sim = GrblSimulator(max_rates=(3000.0, 3000.0, 3000.0), accelerations=(500.0, 500.0, 500.0), time_scale=20.0)
+    gantry = PrinterController()
+    gantry.protocol = GrblProtocol(sim)
+    gantry.protocol.wait_for_banner(timeout=1.0)
+    bb60c = BB60C_INTERFACE(num_captures=4, decimation=8, backend=SimulatedBB60C(realtime=False, seed=0))
+    bb60c.initialize_device()
+    try:
+        fly = FlyScan(gantry, bb60c, feed=3000.0, accel=500.0)
+        counts = fly.scan_row((10.0, 1.0, 1.0), (6.0, 0.0, 0.0), 3)
+    finally:
+        bb60c.close_device()
+        gantry.close_controller()
+        sim.close()
+    ## ~150 captures fall in each bin at 5 MS/s, only max_per_bin (num_captures) are kept
+    np.testing.assert_array_equal(counts, [4, 4, 4])
+    np.testing.assert_array_equal(bb60c.result.n_captures, [4, 4, 4])
+    assert bb60c.result.resident_iq.shape[1] == 4
+    np.testing.assert_allclose(bb60c.result.coords[:, 0], [10.0, 16.0, 22.0])
+
+
+class SlowHost(SimulatedBB60C):
+    ## every read takes longer than the capture it returns, the device buffer fills up
+    ## (buffer_samples large enough for the whole backlog, no sample loss)
+    def get_IQ_into(self, iq_data, purge=False):
+        time.sleep(0.003)
+        return super().get_IQ_into(iq_data, purge)
+
+
+def test_buffered_captures_are_read_after_the_sweep():
+    sim = GrblSimulator(max_rates=(3000.0, 3000.0, 3000.0), accelerations=(500.0, 500.0, 500.0), time_scale=20.0)
+    gantry = PrinterController()
+    gantry.protocol = GrblProtocol(sim)
+    gantry.protocol.wait_for_banner(timeout=1.0)
+    bb60c = BB60C_INTERFACE(num_captures=4, decimation=8, backend=SlowHost(realtime=True, buffer_samples=2**24, seed=0))
+    bb60c.initialize_device()
+    try:
+        fly = FlyScan(gantry, bb60c, feed=3000.0, accel=500.0)
+        counts = fly.scan_row((10.0, 1.0, 1.0), (6.0, 0.0, 0.0), 3)
+    finally:
+        bb60c.close_device()
+        gantry.close_controller()
+        sim.close()
+    ## the host finishes reading well after the gantry stopped, the last bin is still complete
+    np.testing.assert_array_equal(counts, [4, 4, 4])
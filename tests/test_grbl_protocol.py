@@ -0,0 +1,41 @@
+import pytest
+from classes.grbl_protocol import GrblProtocol, GrblError, parse_status
+from classes.grbl_sim import GrblSimulator
+
+
+@pytest.fixture
+def protocol():
+    sim = GrblSimulator(time_scale=200.0)
+    protocol = GrblProtocol(sim)
+    assert protocol.wait_for_banner(timeout=1.0)
+    yield protocol
+    protocol.close()
+    sim.close()
+
+
+def test_parse_status():
+    status = parse_status('<Run|MPos:1.000,2.500,-3.000|FS:300,0>')
+    assert status['state'] == 'Run'
+    assert status['MPos'] == (1.0, 2.5, -3.0)
+    assert status['FS'] == (300.0, 0.0)
+
+
+def test_stream_program(protocol):
+    ## more lines than fit in the RX buffer and the planner at once
+    lines = [f'G1 X{i % 10} Y{i % 7} Z0 F6000' for i in range(200)] + ['; comment', '', 'G0 X1 Y2 Z3']
+    assert protocol.stream(lines) == 201
+    protocol.send('G4 P0')
+    assert protocol.request_status()['MPos'] == (1.0, 2.0, 3.0)
+    assert protocol.pending() == 0
+
+
+def test_stream_stops_at_error(protocol):
+    lines = ['G0 X1 Y1 Z1', 'M999'] + ['G0 X2 Y2 Z2']*50
+    with pytest.raises(GrblError) as error:
+        protocol.stream(lines)
+    assert error.value.command == 'M999'
+
+
+def test_line_too_long(protocol):
+    with pytest.raises(ValueError):
+        protocol.send('G0 X' + '1'*200)
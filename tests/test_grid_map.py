@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from classes.grid_map import GridMap, assemble_grid
+from classes import scan_path
+
+
+def serpentine_coords(num_cols=4, num_rows=3):
+    ## X/Z scan at fixed Y, visited row by row in alternating directions
+    grid = scan_path.rect_grid((1, 1, 1), (6, 0, 0), (0, 0, 6), num_cols, num_rows)
+    order = scan_path.serpentine(num_cols, num_rows)
+    return grid[order]
+
+
+def test_serpentine_lands_on_the_grid():
+    coords = serpentine_coords()
+    values = coords[:, 0] + 10*coords[:, 2]
+    grid = assemble_grid(coords, values)
+    assert grid.names == ('x', 'z')
+    assert grid.shape == (4, 3)
+    np.testing.assert_allclose(grid.axes[0], [1, 7, 13, 19])
+    np.testing.assert_allclose(grid.axes[1], [1, 7, 13])
+    cells = grid.coordinates()
+    np.testing.assert_allclose(grid.values, cells[..., 0] + 10*cells[..., 1])
+    assert np.all(grid.counts == 1)
+
+
+def test_missing_and_nan_points():
+    coords = serpentine_coords()
+    values = np.arange(len(coords), dtype=float)
+    values[3] = np.nan ## no peak found
+    coords[5] = np.nan ## no coordinates recorded
+    grid = assemble_grid(coords, values)
+    assert np.isnan(grid.values).sum() == 2
+    assert grid.counts.sum() == len(coords) - 1
+    with pytest.raises(ValueError):
+        assemble_grid(coords, values[:-1])
+
+
+def test_step_snaps_jitter_and_keeps_empty_rows():
+    coords = np.array([[0.0, 0, 0], [2.02, 0, 0], [5.97, 0, 0]])
+    grid = assemble_grid(coords, [1.0, 2.0, 3.0], step=2.0)
+    np.testing.assert_allclose(grid.axes[0], [0, 2, 4, 6])
+    np.testing.assert_array_equal(grid.counts, [1, 1, 0, 1])
+    assert np.isnan(grid.values[2])
+
+
+def test_repeated_cells_reduce():
+    coords = np.array([[0.0, 0, 0], [1, 0, 0], [0, 0, 0.01]])
+    values = [1.0, 5.0, 3.0]
+    np.testing.assert_allclose(assemble_grid(coords, values).values, [2.0, 5.0])
+    np.testing.assert_allclose(assemble_grid(coords, values, reduce='max').values, [3.0, 5.0])
+    np.testing.assert_allclose(assemble_grid(coords, values, reduce='last').values, [3.0, 5.0])
+    with pytest.raises(ValueError):
+        assemble_grid(coords, values, reduce='median')
+
+
+def test_three_dimensional_map():
+    x, y, z = np.meshgrid([0.0, 1], [0.0, 2, 4], [0.0, 3], indexing='ij')
+    coords = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    grid = assemble_grid(coords, coords.sum(axis=1))
+    assert grid.names == ('x', 'y', 'z')
+    assert grid.shape == (2, 3, 2)
+    np.testing.assert_allclose(grid.values, grid.coordinates().sum(axis=-1))
+
+
+def test_save_and_load(tmp_path):
+    coords = serpentine_coords()
+    spectra = np.random.default_rng(0).standard_normal((len(coords), 5))
+    grid = assemble_grid(coords, spectra)
+    path = str(tmp_path / 'map.npz')
+    grid.save(path)
+    loaded = GridMap.load(path)
+    assert loaded.names == grid.names
+    np.testing.assert_array_equal(loaded.values, grid.values)
+    np.testing.assert_array_equal(loaded.counts, grid.counts)
+    for a, b in zip(loaded.axes, grid.axes):
+        np.testing.assert_array_equal(a, b)
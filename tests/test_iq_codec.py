@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from classes.iq_codec import ChunkedIQ, decode, encode, encode_chunks
+from classes.scan_storage import ScanWriter
+from classes.scan_reader import open_scan
+
+
+def random_iq(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(shape) + 1j*rng.standard_normal(shape)).astype(np.complex64)
+
+
+@pytest.mark.parametrize('codec', [None, 'zlib', 'lzma'])
+def test_lossless_round_trip(codec):
+    iq = random_iq((3, 4, 256))
+    np.testing.assert_array_equal(decode(encode(iq, codec), iq.shape, codec), iq)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        encode(random_iq((1, 8)), 'gzip')
+
+
+def test_quantization_error_is_bounded():
+    ## one scale per capture: a weak capture keeps its own resolution next to a strong one
+    iq = random_iq((2, 1024))
+    iq[1] *= 1e-4
+    decoded = decode(encode(iq, 'zlib', quantize=True), iq.shape, 'zlib', quantize=True)
+    for capture, back in zip(iq, decoded):
+        scale = np.abs(capture.view(np.float32)).max() / 32767
+        assert np.abs(back.view(np.float32) - capture.view(np.float32)).max() <= scale/2 * 1.001
+
+
+def test_chunked_points():
+    iq = random_iq((10, 2, 64))
+    chunked = ChunkedIQ(encode_chunks(iq, 'zlib', chunk_points=4))
+    assert len(chunked) == 10
+    for i in (0, 5, 9, -1):
+        np.testing.assert_array_equal(chunked[i], iq[i])
+    with pytest.raises(IndexError):
+        chunked[10]
+
+
+@pytest.mark.parametrize('quantize', [False, True])
+def test_encoded_scan_round_trip(tmp_path, quantize):
+    path = str(tmp_path / 'scan')
+    iqs = [random_iq((2 + i, 128), seed=i) for i in range(3)]
+    with ScanWriter(path, freqs=np.arange(8.0), iq_codec='lzma', iq_quantize=quantize) as writer:
+        for i, iq in enumerate(iqs):
+            writer.append(iq, np.zeros(8), peak_indx=None, peak=np.nan, coords=(i, 0.0, 0.0))
+    scan = open_scan(path)
+    assert scan.meta['iq_encoding'] == {'codec': 'lzma', 'quantized': quantize}
+    for i, iq in enumerate(iqs):
+        if quantize:
+            np.testing.assert_allclose(scan.iq[i], iq, atol=1e-3)
+        else:
+            np.testing.assert_array_equal(scan.iq[i], iq)
+
+
+def test_encoded_pickle_round_trip(tmp_path):
+    from classes.analyzer_backend import SimulatedBB60C
+    from classes.bb60c_class import BB60C_INTERFACE
+    bb60c = BB60C_INTERFACE(num_captures=2, iq_codec='zlib', backend=SimulatedBB60C(realtime=False, seed=0))
+    bb60c.initialize_device()
+    bb60c.set_dir(str(tmp_path))
+    for _ in range(3):
+        bb60c.capture_data()
+    bb60c.close_device()
+    bb60c.save_data('encoded')
+    scan = open_scan(str(tmp_path / 'encoded.pkl'))
+    for i in range(3):
+        np.testing.assert_array_equal(scan.iq[i], bb60c.result.get_iq(i))
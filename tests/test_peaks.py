@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from classes.peaks import window_peaks, interpolate_peaks
+
+
+def test_window_peaks():
+    spectra = np.full((4, 64), -100.0)
+    spectra[0, 33] = -40.0             ## peak inside the window
+    spectra[1, 20] = -40.0             ## outside the window
+    spectra[2, 28:37] = -100.0 + np.arange(9)  ## rising edge, maximum on the window edge
+    spectra[3, :] = np.nan             ## nothing captured
+    np.testing.assert_array_equal(window_peaks(spectra, 32, 4), [33, -1, -1, -1])
+
+
+def test_prominence():
+    spectra = np.full((2, 64), -100.0)
+    spectra[0, 32] = -99.5
+    spectra[1, 32] = -90.0
+    np.testing.assert_array_equal(window_peaks(spectra, 32, 4, min_prominence=1.0), [-1, 32])
+
+
+@pytest.mark.parametrize('method', ['parabolic', 'gaussian'])
+def test_interpolation_recovers_offset(method):
+    ## Gaussian main lobe between bins: the 'gaussian' estimate is exact, 'parabolic' close
+    bins = np.arange(64)
+    true_offset = 0.3
+    spectra = (-40.0 - 3.0*(bins - 32 - true_offset)**2)[None, :]
+    offsets, peaks = interpolate_peaks(spectra, [32], method)
+    tolerance = 1e-9 if method == 'gaussian' else 0.15
+    assert offsets[0] == pytest.approx(true_offset, abs=tolerance)
+    assert peaks[0] >= spectra[0, 32]
+
+
+def test_interpolation_without_peak():
+    offsets, peaks = interpolate_peaks(np.zeros((2, 8)), [-1, 0])
+    np.testing.assert_array_equal(offsets, [0.0, 0.0])
+    assert np.all(np.isnan(peaks))
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        interpolate_peaks(np.zeros((1, 8)), [3], 'cubic')
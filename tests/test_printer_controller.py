@@ -0,0 +1,71 @@
+import pytest
+from classes.g_code_cntrl_class import PrinterController
+from classes.grbl_protocol import GrblProtocol, GrblError, GrblAlarm
+from classes.grbl_sim import GrblSimulator
+
+
+class StubProtocol:
+    ## acknowledges every line, status reports come from a fixed list
+    def __init__(self, states):
+        self.states = list(states)
+
+    def send(self, command, timeout=60.0):
+        return True
+
+    def request_status(self, timeout=2.0):
+        return {'state': self.states.pop(0) if len(self.states) > 1 else self.states[0]}
+
+
+@pytest.fixture
+def gantry():
+    sim = GrblSimulator(time_scale=50.0)
+    gantry = PrinterController()
+    gantry.protocol = GrblProtocol(sim)
+    gantry.protocol.wait_for_banner(timeout=1.0)
+    yield gantry
+    gantry.close_controller()
+    sim.close()
+
+
+def test_move_and_wait_until_idle(gantry):
+    gantry.move_to(5, 1, 3)
+    gantry.send_command()
+    assert gantry.wait_until_idle()
+    assert gantry.get_status()['MPos'] == (5.0, 1.0, 3.0)
+
+
+def test_error_reply_raises(gantry):
+    with pytest.raises(GrblError):
+        gantry.protocol.send('M999')
+
+
+def test_alarm_state_raises():
+    gantry = PrinterController()
+    gantry.protocol = StubProtocol(['Run', 'Alarm'])
+    with pytest.raises(GrblAlarm):
+        gantry.wait_until_idle(poll_interval=0.0)
+
+
+def test_never_idle_raises():
+    gantry = PrinterController()
+    gantry.protocol = StubProtocol(['Run'])
+    with pytest.raises(TimeoutError):
+        gantry.wait_until_idle(timeout=0.05, poll_interval=0.0)
+
+
+def test_banner_over_pty():
+    ## the banner is sent once the port is opened, not lost to pyserial's input flush
+    pytest.importorskip('serial')
+    sim = GrblSimulator(time_scale=50.0)
+    gantry = PrinterController(port=sim.serve_pty())
+    try:
+        assert gantry.init_controller(confirm_origin=False)
+        assert gantry.protocol.banner == GrblSimulator.BANNER
+        assert gantry.wait_until_idle()
+        ## a second client gets its own banner
+        gantry.close_controller()
+        assert gantry.init_controller(confirm_origin=False)
+        assert gantry.protocol.banner == GrblSimulator.BANNER
+    finally:
+        gantry.close_controller()
+        sim.close()
@@ -0,0 +1,44 @@
+import numpy as np
+from classes import scan_path
+
+
+def test_rect_grid_is_row_major():
+    grid = scan_path.rect_grid((10, 0, 5), (-6, 0, 0), (0, 0, 6), 3, 2)
+    assert grid.shape == (6, 3)
+    np.testing.assert_array_equal(grid[:, 0], [10, 4, -2, 10, 4, -2])
+    np.testing.assert_array_equal(grid[:, 2], [5, 5, 5, 11, 11, 11])
+
+
+def test_serpentine_reverses_odd_rows():
+    np.testing.assert_array_equal(scan_path.serpentine(3, 3), [0, 1, 2, 5, 4, 3, 6, 7, 8])
+
+
+def test_serpentine_beats_raster():
+    grid = scan_path.rect_grid((0, 0, 0), (6, 0, 0), (0, 0, 6), 5, 4)
+    assert (scan_path.estimate_travel_time(grid, scan_path.serpentine(5, 4))
+            < scan_path.estimate_travel_time(grid, scan_path.raster(len(grid))))
+
+
+def test_travel_optimal_is_a_shorter_permutation():
+    points = np.random.default_rng(0).uniform(0, 100, (40, 3))
+    order = scan_path.travel_optimal(points)
+    assert order[0] == 0
+    assert sorted(order) == list(range(len(points)))
+    assert scan_path.estimate_travel_time(points, order) < scan_path.estimate_travel_time(points)
+
+
+def test_polar_grid_centre_and_rings():
+    points = scan_path.polar_grid((0, 0, 0), [0, 5], 8)
+    assert len(points) == 9
+    np.testing.assert_allclose(np.hypot(points[1:, 0], points[1:, 2]), 5.0)
+
+
+def test_run_path_records_where_each_acquisition_was(fake_gantry):
+    gantry = fake_gantry
+    grid = scan_path.rect_grid((0, 0, 0), (6, 0, 0), (0, 0, 6), 3, 2)
+    taken = []
+    order = scan_path.run_path(gantry, grid, scan_path.serpentine(3, 2),
+                               on_point=lambda indx, point: taken.append(gantry.get_coordinates()))
+    ## the i-th acquisition is at grid[order[i]], whatever the ordering
+    np.testing.assert_array_equal(np.array(taken), grid[order])
+    np.testing.assert_array_equal(order, [0, 1, 2, 5, 4, 3])
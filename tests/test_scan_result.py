@@ -0,0 +1,64 @@
+import shutil
+import numpy as np
+from classes.analyzer_backend import SimulatedBB60C
+from classes.bb60c_class import BB60C_INTERFACE
+from classes.scan_result import ScanResult
+from classes.scan_reader import open_scan
+
+
+def random_iq(rng, n_rows, n_samples=8):
+    return (rng.standard_normal((n_rows, n_samples)) + 1j*rng.standard_normal((n_rows, n_samples))).astype(np.complex64)
+
+
+def test_growth_stays_within_budget(tmp_path):
+    ## 10 points fit, but growing 4 -> 8 needs the old 4 alongside: capacity 6, the rest spills
+    point_bytes = 8*np.dtype(np.complex64).itemsize
+    result = ScanResult(4, capacity=4, iq_budget=10*point_bytes, spill_path=str(tmp_path / 'raw_spill.iq'))
+    rng = np.random.default_rng(0)
+    iqs = [random_iq(rng, 1) for _ in range(12)]
+    for iq in iqs:
+        result.append(np.zeros(4), iq)
+    result.close()
+    assert result.n_resident == 6
+    assert result.iq_nbytes() <= 10*point_bytes
+    assert sorted(result.spilled) == list(range(6, 12))
+    for i, iq in enumerate(iqs):
+        np.testing.assert_array_equal(result.iq[i], iq)
+
+
+def test_iq_with_nothing_resident(tmp_path):
+    ## the very first point is over the budget
+    result = ScanResult(4, iq_budget=1, spill_path=str(tmp_path / 'raw_spill.iq'))
+    rng = np.random.default_rng(0)
+    iqs = [random_iq(rng, 2) for _ in range(3)]
+    for iq in iqs:
+        result.append(np.zeros(4), iq)
+    result.close()
+    assert result.n_resident == 0
+    assert len(result.iq) == 3
+    np.testing.assert_array_equal(result.iq[2], iqs[2])
+
+
+def spilling_scan(directory, name, seed):
+    bb60c = BB60C_INTERFACE(num_captures=2, memory_budget=100_000, backend=SimulatedBB60C(realtime=False, seed=seed))
+    bb60c.initialize_device()
+    bb60c.set_dir(str(directory))
+    for _ in range(3):
+        bb60c.capture_data()
+    bb60c.close_device()
+    bb60c.save_data(name)
+    bb60c.result.close()
+    return [bb60c.result.get_iq(i).copy() for i in range(3)]
+
+
+def test_second_scan_keeps_the_first_spill(tmp_path):
+    first = spilling_scan(tmp_path, 'first', seed=0)
+    second = spilling_scan(tmp_path, 'second', seed=1)
+    assert sorted(p.name for p in tmp_path.glob('*.iq')) == ['raw_spill.iq', 'raw_spill_1.iq']
+    ## the spill path is relative to the pickle, the directory can move
+    moved = tmp_path.parent / 'moved'
+    shutil.move(str(tmp_path), str(moved))
+    for name, iqs in (('first', first), ('second', second)):
+        scan = open_scan(str(moved / f'{name}.pkl'))
+        for i, iq in enumerate(iqs):
+            np.testing.assert_array_equal(scan.iq[i], iq)
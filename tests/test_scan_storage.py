@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pytest
+from classes.scan_storage import ScanWriter, INDEX_FILE
+from classes.scan_reader import open_scan
+
+
+def write_scan(path, n=5, **kwargs):
+    rng = np.random.default_rng(0)
+    iqs, spectra = [], []
+    with ScanWriter(path, meta={'center_freq': 4.6e9}, freqs=np.arange(64.0), **kwargs) as writer:
+        for i in range(n):
+            ## adaptive dwell: the number of captures varies per acquisition
+            iq = (rng.standard_normal((2 + i % 3, 32)) + 1j*rng.standard_normal((2 + i % 3, 32))).astype(np.complex64)
+            spectrum = rng.standard_normal(64)
+            peak = np.nan if i == 2 else float(spectrum.max())
+            writer.append(iq, spectrum, peak_indx=None if i == 2 else int(spectrum.argmax()), peak=peak,
+                          coords=(i, 1.0, 2*i), timestamp=100.0 + i)
+            iqs.append(iq)
+            spectra.append(spectrum)
+    return iqs, np.array(spectra)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'scan')
+    iqs, spectra = write_scan(path)
+    scan = open_scan(path)
+    assert len(scan) == 5
+    assert scan.meta['center_freq'] == 4.6e9
+    np.testing.assert_array_equal(scan.freqs, np.arange(64.0))
+    np.testing.assert_array_equal(scan.spectra, spectra)
+    np.testing.assert_array_equal(scan.n_captures, [len(iq) for iq in iqs])
+    for i, iq in enumerate(iqs):
+        np.testing.assert_array_equal(scan.iq[i], iq)
+    np.testing.assert_array_equal(scan.iq[3, 1], iqs[3][1])
+    assert np.isnan(scan.peaks[2]) and scan.peaks_indxs[2] == -1
+    np.testing.assert_array_equal(scan.coords[:, 2], [0, 2, 4, 6, 8])
+    np.testing.assert_array_equal(scan.timestamps, 100.0 + np.arange(5))
+
+
+def test_truncated_index_keeps_complete_acquisitions(tmp_path):
+    ## a crash in the middle of an index line
+    path = str(tmp_path / 'scan')
+    iqs, _ = write_scan(path)
+    index = os.path.join(path + '.scan', INDEX_FILE)
+    with open(index) as f:
+        content = f.read()
+    with open(index, 'w') as f:
+        f.write(content[:-20])
+    scan = open_scan(path)
+    assert len(scan) == 4
+    np.testing.assert_array_equal(scan.iq[3], iqs[3])
+
+
+def test_existing_scan_is_not_overwritten(tmp_path):
+    path = str(tmp_path / 'scan')
+    write_scan(path)
+    with pytest.raises(FileExistsError):
+        ScanWriter(path)
+
+
+def test_pickle_after_writer_keeps_raw_iq(tmp_path):
+    ## open_writer drops raw IQ from memory (keep_raw=False), save_data reads it back from the .scan
+    from classes.analyzer_backend import SimulatedBB60C
+    from classes.bb60c_class import BB60C_INTERFACE
+    bb60c = BB60C_INTERFACE(num_captures=2, backend=SimulatedBB60C(realtime=False, seed=0))
+    bb60c.initialize_device()
+    bb60c.set_dir(str(tmp_path))
+    bb60c.open_writer('w')
+    for _ in range(3):
+        bb60c.capture_data()
+    bb60c.close_device()
+    bb60c.close_writer()
+    assert bb60c.result.get_iq(0) is None
+    with pytest.raises(ValueError):
+        bb60c.calc_fft()
+    bb60c.save_data('w')
+    written = open_scan(str(tmp_path / 'w'))
+    pickled = open_scan(str(tmp_path / 'w.pkl'))
+    np.testing.assert_array_equal(pickled.n_captures, [2, 2, 2])
+    for i in range(3):
+        np.testing.assert_array_equal(pickled.iq[i], written.iq[i])
+    np.testing.assert_array_equal(pickled.spectra, written.spectra)
+
+
+def test_slice_of_ragged_acquisitions_is_zero_padded(tmp_path):
+    ## write_scan gives 2, 3, 4, 2, 3 captures
+    path = str(tmp_path / 'scan')
+    iqs, _ = write_scan(path)
+    scan = open_scan(path)
+    block = scan.iq[0:3]
+    assert block.shape == (3, 4, 32)
+    for i in range(3):
+        np.testing.assert_array_equal(block[i, :scan.n_captures[i]], iqs[i])
+        assert not block[i, scan.n_captures[i]:].any()
+    np.testing.assert_array_equal(scan.iq[1:3, 0], [iqs[1][0], iqs[2][0]])
+    assert scan.iq[2:2].shape[0] == 0
@@ -0,0 +1,43 @@
+import time
+import pytest
+from classes.timing import StageTimer
+
+
+def test_stages_and_counters():
+    timer = StageTimer()
+
+    @timer.timed('work')
+    def work():
+        time.sleep(0.01)
+    for _ in range(3):
+        work()
+    with timer.stage('block'):
+        pass
+    timer.count('points', 2)
+    summary = timer.summary()
+    assert summary['stages']['work']['count'] == 3
+    assert summary['stages']['work']['total_s'] >= 0.03
+    assert summary['stages']['block']['count'] == 1
+    assert summary['counters'] == {'points': 2}
+
+
+def test_rate_ignores_time_outside_the_scan():
+    timer = StageTimer()
+    time.sleep(0.05) ## setup
+    for _ in range(5):
+        time.sleep(0.02)
+        timer.count('points')
+    time.sleep(0.2) ## plotting, saving ...
+    summary = timer.summary()
+    ## 4 intervals of ~20 ms, not 5 points over the ~0.35 s run
+    assert summary['scan_s'] == pytest.approx(0.08, abs=0.03)
+    assert summary['points_per_minute'] == pytest.approx(60*4/summary['scan_s'])
+    assert summary['points_per_minute'] > 2*60*5/summary['wall_s']
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer(enabled=False)
+    with timer.stage('block'):
+        timer.count('points')
+    summary = timer.summary()
+    assert summary['stages'] == {} and summary['counters'] == {}